@@ -0,0 +1,106 @@
+"""Times the example workloads on synthetic canvases
+
+    python -m benchmarks --sizes 64 128 --output results.json
+    python -m benchmarks --baseline results.json
+
+Each result records the fastest wall time of the repeats, the peak memory traced
+over a separate run (tracing slows the code down, so it is kept out of the timings)
+and pixels per second. Given a baseline, every result is compared against it, and the
+exit code is 1 when any got slower by more than the tolerance.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from .workloads import WORKLOADS, synthetic
+
+
+def measure(name, size, repeats):
+    workload, canvases = WORKLOADS[name]
+
+    def run():
+        args = [synthetic(size, seed) for seed in range(canvases)]
+        start = time.perf_counter()
+        workload(*args)
+        return time.perf_counter() - start
+
+    seconds = min(run() for _ in range(repeats))
+
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    pixels = size[0] * size[1] * canvases
+    return {'workload': name,
+            'size': list(size),
+            'pixels': pixels,
+            'seconds': seconds,
+            'peak_kib': peak // 1024,
+            'pixels_per_second': pixels / seconds if seconds else None}
+
+
+def compare(results, baseline, tolerance):
+    """Prints how each result compares to the baseline
+    :return: whether any result is slower than the baseline by more than tolerance
+    """
+    previous = {(i['workload'], tuple(i['size'])): i for i in baseline['results']}
+    regressed = False
+    for result in results:
+        old = previous.get((result['workload'], tuple(result['size'])))
+        if old is None:
+            continue
+        ratio = result['seconds'] / old['seconds'] if old['seconds'] else float('inf')
+        slower = ratio > 1 + tolerance
+        regressed = regressed or slower
+        print('{:32} {:>11} {:8.2f}x time {:8.2f}x memory{}'.format(
+            result['workload'], '{}x{}'.format(*result['size']), ratio,
+            result['peak_kib'] / old['peak_kib'] if old['peak_kib'] else float('inf'),
+            '  SLOWER' if slower else ''))
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[32, 64, 128],
+                        help='widths of the square canvases to run on')
+    parser.add_argument('--workloads', nargs='+', choices=sorted(WORKLOADS), default=list(WORKLOADS))
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', help='file to write the results to, as json')
+    parser.add_argument('--baseline', help='results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='fraction a workload can slow down by before it counts as slower')
+    args = parser.parse_args(argv)
+
+    results = []
+    for name in args.workloads:
+        for width in args.sizes:
+            result = measure(name, (width, width), args.repeats)
+            results.append(result)
+            print('{:32} {:>11} {:10.3f}s {:10} KiB {:12.0f} pixels/s'.format(
+                name, '{}x{}'.format(*result['size']), result['seconds'], result['peak_kib'],
+                result['pixels_per_second'] or 0))
+
+    report = {'python': platform.python_version(),
+              'platform': platform.platform(),
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print()
+        return 1 if compare(results, baseline, args.tolerance) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""The workloads of EXAMPLES/sort_an_image.py, run on synthetic canvases instead of image files
+Those that sili-canvas also runs are taken from its recipes, so that the two can't drift apart
+"""
+from functools import partial
+import random
+
+from canvas import *
+from canvas import cli
+from canvas.QuadTree import Seedling
+
+
+def synthetic(size, seed=0):
+    """A canvas of gradients and noise, so that sorting has work to do on every size"""
+    r = random.Random(seed)
+    width, length = size
+    return Canvas([((x * 255 // width + r.randrange(64)) % 256,
+                    (y * 255 // length + r.randrange(64)) % 256,
+                    r.randrange(256))
+                   for y in range(length) for x in range(width)], size)
+
+
+def _recipe(name):
+    """A recipe of sili-canvas, sorting by yiq and cutting out triangles as the examples do"""
+    return partial(cli.RECIPES[name], sorter=tools.yiq, shape=tools.triangle, size=None)
+
+
+def rearrange_shape(c: Canvas):
+    # Unlike the sili-canvas recipe, this chains two shapes
+    layer = Layer(c)
+    layer.intersection(tools.circle)
+    layer.intersection(tools.triangle)
+    layer.rearrange(tools.yiq)
+    layer.unscope()
+
+
+def operations_within_tessellation(c: Canvas):
+    splitter = Splitter(c)
+    for i in splitter.fragment((20, 20)):
+        rectangle = Splitter(i)
+        for x, width in enumerate(rectangle.crack(sizes_per_width=2)):
+            width = Layer(width)
+            if x == 0:
+                width.intersection(tools.vertical_lines, reversed, tuple, tools.triangle)
+            else:
+                width.intersection(tools.vertical_lines, tools.triangle)
+            width.rearrange(tools.yiq)
+            width.unscope()
+        rectangle.unscope_all()
+        for y, length in enumerate(rectangle.crack(sizes_per_length=2)):
+            length = Layer(length)
+            if y == 0:
+                length.intersection(reversed, tuple, tools.triangle)
+            else:
+                length.intersection(tools.triangle)
+            length.rearrange(tools.yiq)
+            length.unscope()
+        rectangle.unscope_all()
+    splitter.unscope_all()
+
+
+def intercept(c0: Canvas, c1: Canvas):
+    tracker0 = Tracker(c0)
+    tracker0.rearrange(tools.yiq)
+    tracker1 = Tracker(c1)
+    tracker1.rearrange(tools.yiq)
+    tracker = Binder(tracker0, tracker1)
+
+    constructor = Constructor(tracker,
+                              Canvas.from_empty_size(tracker.size, CanvasNone),
+                              tracker.movement(tools.TwoDimensional.linear),
+                              tracker.transition(tools.ThreeDimensional.linear))
+
+    s_template = Canvas([
+        1,0,0,0,1,
+        1,0,1,1,1,
+        1,0,0,0,1,
+        1,1,1,0,1,
+        1,0,0,0,1,
+    ], (5, 5))
+    s_template.replace(1, None)
+    s_template.replace(0, CanvasNone)
+    constructor.intercept(0.5, insert_canvas=s_template)
+
+
+def seedling(c: Canvas):
+    seed = Seedling(c)
+    for _ in range(20):
+        seed.nav_importance(10)
+
+
+def fill_in(c: Canvas):
+    # Sixteen tiles of one size, of which only the first fill is wanted
+    size = max(1, c.width // 4), max(1, c.length // 4)
+    splitter = Splitter(c)
+    tiles = list(splitter.fragment(size))[:16]
+    target = Canvas.from_empty_size((size[0] * 4, size[1] * 4), CanvasNone)
+    list(Merger(tiles).fill_in_canvas(target, limit=1))
+
+
+# name: (workload, how many canvases it takes)
+WORKLOADS = {'rearrange': (_recipe('rearrange'), 1),
+             'rearrange_segments': (_recipe('rearrange_segments'), 1),
+             'rearrange_shape': (rearrange_shape, 1),
+             'rearrange_tessellation': (_recipe('rearrange_tessellation'), 1),
+             'fragment_shape': (_recipe('fragment_shape'), 1),
+             'operations_within_tessellation': (operations_within_tessellation, 1),
+             'intercept': (intercept, 2),
+             'seedling': (seedling, 1),
+             'fill_in': (fill_in, 1)}
@@ -1,10 +1,31 @@
 from collections import abc
 from typing import Type
 from copy import copy
+from itertools import chain, compress, islice, repeat
+from operator import is_not
+import mmap
+import re
+
+from .common import bitmask
 
 
 _empty_slice = slice(None, None, None)
 
+# States held in PackedData.mask, one byte per cell
+_VALUE, _EXCLUDED, _EMPTY = 0, 1, 2
+# Translation tables that turn a mask into compress() selectors
+_IS_EXCLUDED = bytes(int(i == _EXCLUDED) for i in range(256))
+_IS_UNEXCLUDED = bytes(int(i != _EXCLUDED) for i in range(256))
+_UNEXCLUDED_RUNS = re.compile(b'[^\x01]+')
+_RUNS = re.compile(b'\x01+')
+_NOT_VALUE = re.compile(b'[^\x00]')
+# Cells decoded at a time when iterating, so iteration never builds the whole canvas
+_BLOCK = 1 << 16
+# Cells in each block of CowData, which is the most copied when a shared block is written to
+_COW_SHIFT = 9
+_COW_BLOCK = 1 << _COW_SHIFT
+_COW_MASK = _COW_BLOCK - 1
+
 
 class SizeInfo:
     def __init__(self, size):
@@ -23,9 +44,584 @@ class SizeInfo:
         return self.size[1]
 
 
+class MappedBuffer(mmap.mmap):
+    """A memory map with the bytearray methods that PackedData uses on its buffer and mask"""
+    def __contains__(self, item):
+        if isinstance(item, int):
+            item = bytes([item])
+        return self.find(item) != -1
+
+    def count(self, item):
+        # A block at a time, so that a map larger than memory is never read in whole
+        return sum(self[x:x + _BLOCK].count(item) for x in range(0, len(self), _BLOCK))
+
+    def translate(self, table):
+        return b''.join(self[x:x + _BLOCK].translate(table) for x in range(0, len(self), _BLOCK))
+
+    def reverse(self):
+        self[:] = self[::-1]
+
+
+class PackedData(abc.Sequence):
+    """Contiguous storage for canvases of uint8 pixels
+
+    The pixels live in `buffer`, `bands` bytes per cell, and `mask` holds one
+    state byte per cell in place of the in-band None/CanvasNone markers:
+        0 = holds a value, 1 = None, 2 = CanvasNone
+    A single band is read and written as an int, otherwise as a tuple.
+    """
+    def __init__(self, buffer, mask=None, bands: int=3):
+        self.buffer = buffer
+        self.bands = bands
+        self.mask = bytearray(len(buffer) // bands) if mask is None else mask
+
+    @classmethod
+    def from_values(cls, values, bands: int=None):
+        values = list(values)
+        if bands is None:
+            bands = _infer_bands(values)
+        data = cls(bytearray(len(values) * bands), bytearray(len(values)), bands)
+        data._assign(0, values)
+        return data
+
+    def __len__(self):
+        return len(self.mask)
+
+    def __iter__(self):
+        for start in range(0, len(self), _BLOCK):
+            yield from self._decode(start, min(start + _BLOCK, len(self)))
+
+    def __contains__(self, item):
+        if item is None:
+            return _EXCLUDED in self.mask
+        if item is CanvasNone:
+            return _EMPTY in self.mask
+        return any(i == item for i in self)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return self._decode(start, max(start, stop))
+            return [self[x] for x in range(start, stop, step)]
+
+        key = self._index(key)
+        state = self.mask[key]
+        if state == _EXCLUDED:
+            return None
+        if state == _EMPTY:
+            return CanvasNone
+        if self.bands == 1:
+            return self.buffer[key]
+        return tuple(self.buffer[key * self.bands:(key + 1) * self.bands])
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1 and len(value) == max(0, stop - start):
+                self._assign(start, list(value))
+                return
+            for x, i in zip(range(start, stop, step), value):
+                self[x] = i
+            return
+
+        key = self._index(key)
+        if value is None:
+            self.mask[key] = _EXCLUDED
+            return
+        if value is CanvasNone:
+            self.mask[key] = _EMPTY
+            return
+
+        if self.bands == 1:
+            self.buffer[key] = value
+        else:
+            if len(value) != self.bands:
+                raise ValueError('pixel must have {} bands'.format(self.bands))
+            self.buffer[key * self.bands:(key + 1) * self.bands] = bytes(value)
+        self.mask[key] = _VALUE
+
+    def _index(self, key):
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('canvas index out of range')
+        return key
+
+    def _decode(self, start, stop):
+        b = self.bands
+        if b == 1:
+            values = list(self.buffer[start:stop])
+        else:
+            values = list(zip(*[iter(self.buffer[start * b:stop * b])] * b))
+
+        mask = self.mask[start:stop]
+        if mask.count(_VALUE) != len(mask):
+            for match in _NOT_VALUE.finditer(mask):
+                x = match.start()
+                values[x] = None if mask[x] == _EXCLUDED else CanvasNone
+        return values
+
+    def _assign(self, start, values):
+        """Writes values to consecutive cells, starting at start"""
+        stop = start + len(values)
+        if None in values or CanvasNone in values:
+            for x, i in enumerate(values, start):
+                self[x] = i
+            return
+
+        b = self.bands
+        self.buffer[start * b:stop * b] = _pack(values, b)
+        self.mask[start:stop] = bytes(len(values))
+
+    def unexcluded_spans(self):
+        """Returns the (start, stop) of every run of cells that are not None"""
+        return [match.span() for match in _UNEXCLUDED_RUNS.finditer(self.mask)]
+
+    def putdata(self, iterable, option: int=0):
+        """Bulk version of NoneIsImportantTuple.putdata"""
+        if option == 0:
+            values = list(islice(iterable, len(self) - self.mask.count(_EXCLUDED)))
+            position = 0
+            for start, stop in self.unexcluded_spans():
+                if position >= len(values):
+                    break
+                segment = values[position:position + stop - start]
+                self._assign(start, segment)
+                position += len(segment)
+        elif option == 1:
+            source = getattr(iterable, 'data', iterable)
+            if isinstance(source, PackedData) and source.bands == self.bands:
+                self._copy_unexcluded(source)
+                return
+
+            values = list(islice(iterable, len(self)))
+            present = bytes(i is not None for i in values)
+            for match in _RUNS.finditer(present):
+                start, stop = match.span()
+                self._assign(start, values[start:stop])
+
+    def exclude_all(self):
+        self.mask[:] = bytes([_EXCLUDED]) * len(self)
+
+    def copy_from(self, source, start, stop):
+        """Copies cells start to stop from another canvas' data into the same cells"""
+        if isinstance(source, PackedData) and source.bands == self.bands:
+            b = self.bands
+            self.buffer[start * b:stop * b] = source.buffer[start * b:stop * b]
+            self.mask[start:stop] = source.mask[start:stop]
+        else:
+            self._assign(start, source[start:stop])
+
+    def _copy_unexcluded(self, source):
+        for start, stop in source.unexcluded_spans():
+            stop = min(stop, len(self))
+            if start >= stop:
+                break
+            self.copy_from(source, start, stop)
+
+    def getdata(self):
+        if _EXCLUDED not in self.mask:
+            return list(self)
+        return list(compress(self, self.mask.translate(_IS_UNEXCLUDED)))
+
+    @property
+    def excluded(self):
+        return list(compress(range(len(self)), self.mask.translate(_IS_EXCLUDED)))
+
+    @property
+    def unexcluded(self):
+        return list(compress(range(len(self)), self.mask.translate(_IS_UNEXCLUDED)))
+
+    def copy(self):
+        return self.__class__(bytearray(self.buffer), bytearray(self.mask), self.bands)
+
+    def reverse(self):
+        self.mask.reverse()
+        b = self.bands
+        if b == 1:
+            self.buffer.reverse()
+            return
+        # Reversing the bytes also reverses the bands of every pixel, so put them back
+        reversed_buffer = self.buffer[::-1]
+        for x in range(b):
+            self.buffer[x::b] = reversed_buffer[b - 1 - x::b]
+
+
+class ViewData(abc.Sequence):
+    """The cells of a rectangle within another canvas' data, read and written in place
+
+    Cells outside of the parent, and cells set to None, are held by the view
+    itself (as holes), so the parent only ever receives values, as it would
+    from Canvas.insert.
+    """
+    def __init__(self, parent, parent_size, bbox):
+        """
+        :param parent: data of the canvas being viewed, which may be another view
+        :param bbox: (x0, y0, x1, y1) inclusive corners within the parent
+        """
+        self.parent = parent
+        self.parent_size = parent_size
+        x0, y0, x1, y1 = bbox
+        self.corner = x0, y0
+        self.size = max(0, x1 - x0 + 1), max(0, y1 - y0 + 1)
+        self.holes = {}
+
+    def __len__(self):
+        return self.size[0] * self.size[1]
+
+    def __iter__(self):
+        yield from self._read(0, len(self))
+
+    def __contains__(self, item):
+        return item in self._read(0, len(self))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return self._read(start, max(start, stop))
+            return [self[x] for x in range(start, stop, step)]
+
+        key = self._index(key)
+        if key in self.holes:
+            return self.holes[key]
+        position = self._parent_index(key)
+        return None if position is None else self.parent[position]
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1 and len(value) == max(0, stop - start):
+                self._write(start, list(value))
+                return
+            for x, i in zip(range(start, stop, step), value):
+                self[x] = i
+            return
+
+        key = self._index(key)
+        position = self._parent_index(key)
+        if value is None or position is None:
+            self.holes[key] = value
+        else:
+            self.holes.pop(key, None)
+            self.parent[position] = value
+
+    def _index(self, key):
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('canvas index out of range')
+        return key
+
+    def _parent_index(self, key):
+        y, x = divmod(key, self.size[0])
+        x, y = x + self.corner[0], y + self.corner[1]
+        if 0 <= x < self.parent_size[0] and 0 <= y < self.parent_size[1]:
+            return x + y * self.parent_size[0]
+        return None
+
+    def _row_pieces(self, start, stop):
+        """Splits cells start to stop at the end of every row
+        :return: (start, stop, parent start, in range start, in range stop) of each piece,
+            where in range start to in range stop are the cells within the parent
+        """
+        width, _ = self.size
+        parent_width, parent_length = self.parent_size
+        x0, y0 = self.corner
+        # Columns of the view that are within the parent
+        first, last = min(max(-x0, 0), width), min(max(parent_width - x0, 0), width)
+
+        while start < stop:
+            y, x = divmod(start, width)
+            end = min(stop, start + width - x)
+            row_start = start - x
+            if 0 <= y + y0 < parent_length:
+                a, b = max(start, row_start + first), min(end, row_start + last)
+            else:
+                a = b = end
+            yield start, end, (y + y0) * parent_width + x0 + a - row_start, a, max(a, b)
+            start = end
+
+    def _read(self, start, stop):
+        values = [None] * (stop - start)
+        for _, _, position, a, b in self._row_pieces(start, stop):
+            values[a - start:b - start] = self.parent[position:position + b - a]
+        for key, value in self.holes.items():
+            if start <= key < stop:
+                values[key - start] = value
+        return values
+
+    def _write(self, start, values):
+        for piece_start, piece_stop, position, a, b in self._row_pieces(start, start + len(values)):
+            in_range = values[a - start:b - start]
+            if None in in_range:
+                for x, i in enumerate(in_range, a):
+                    self[x] = i
+            elif in_range:
+                self.parent[position:position + b - a] = in_range
+                for x in range(a, b):
+                    self.holes.pop(x, None)
+            # Outside of the parent, where None is the default
+            for x in chain(range(piece_start, a), range(b, piece_stop)):
+                if values[x - start] is None:
+                    self.holes.pop(x, None)
+                else:
+                    self.holes[x] = values[x - start]
+
+    def putdata(self, iterable, option: int=0):
+        """Bulk version of NoneIsImportantTuple.putdata"""
+        if option == 0:
+            current = self._read(0, len(self))
+            iterable = iter(iterable)
+            for x, i in enumerate(current):
+                if i is None:
+                    continue
+                try:
+                    current[x] = next(iterable)
+                except StopIteration:
+                    break
+            self._write(0, current)
+        elif option == 1:
+            values = list(islice(iterable, len(self)))
+            present = bytes(i is not None for i in values)
+            for match in _RUNS.finditer(present):
+                start, stop = match.span()
+                self._write(start, values[start:stop])
+
+    def copy(self):
+        """Returns the cells as storage of their own, packed when the viewed canvas is"""
+        values = self._read(0, len(self))
+        root = self.parent
+        while isinstance(root, ViewData):
+            root = root.parent
+        if isinstance(root, PackedData):
+            return PackedData.from_values(values, root.bands)
+        return values
+
+    def reverse(self):
+        values = self._read(0, len(self))
+        values.reverse()
+        self._write(0, values)
+
+
+class CowData(abc.Sequence):
+    """A list of cells split into blocks, which copies share until one side writes
+
+    Copying only copies the table of blocks, and marks every block as shared by
+    both sides. Writing to a shared block first gives the writer its own copy of
+    that block, so cells that are only read are never copied.
+    """
+    def __init__(self, blocks, length: int, owned=None):
+        self.blocks = blocks
+        self.length = length
+        # Whether each block is this storage's alone, and so can be written in place
+        self.owned = bytearray(len(blocks)) if owned is None else owned
+
+    @classmethod
+    def from_values(cls, values):
+        values = list(values)
+        blocks = [values[x:x + _COW_BLOCK] for x in range(0, len(values), _COW_BLOCK)]
+        return cls(blocks, len(values), bytearray([1]) * len(blocks))
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return chain.from_iterable(self.blocks)
+
+    def __contains__(self, item):
+        return any(item in block for block in self.blocks)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return self._read(start, max(start, stop))
+            return [self[x] for x in range(start, stop, step)]
+
+        key = self._index(key)
+        return self.blocks[key >> _COW_SHIFT][key & _COW_MASK]
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1 and len(value) == max(0, stop - start):
+                self._write(start, list(value))
+                return
+            for x, i in zip(range(start, stop, step), value):
+                self[x] = i
+            return
+
+        key = self._index(key)
+        self._own(key >> _COW_SHIFT)[key & _COW_MASK] = value
+
+    def _index(self, key):
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('canvas index out of range')
+        return key
+
+    def _own(self, block):
+        """Returns block x to be written to, copying it first if it's shared"""
+        if not self.owned[block]:
+            self.blocks[block] = self.blocks[block].copy()
+            self.owned[block] = 1
+        return self.blocks[block]
+
+    def _read(self, start, stop):
+        if start >= stop:
+            return []
+        first, last = start >> _COW_SHIFT, (stop - 1) >> _COW_SHIFT
+        if first == last:
+            return self.blocks[first][start & _COW_MASK:((stop - 1) & _COW_MASK) + 1]
+        values = self.blocks[first][start & _COW_MASK:]
+        for block in self.blocks[first + 1:last]:
+            values.extend(block)
+        values.extend(self.blocks[last][:((stop - 1) & _COW_MASK) + 1])
+        return values
+
+    def _write(self, start, values):
+        position = 0
+        while position < len(values):
+            x = start + position
+            offset = x & _COW_MASK
+            cells = min(_COW_BLOCK - offset, len(values) - position)
+            block = x >> _COW_SHIFT
+            segment = values[position:position + cells]
+            # Blocks that don't change are left shared
+            if self.blocks[block][offset:offset + cells] != segment:
+                self._own(block)[offset:offset + cells] = segment
+            position += cells
+
+    def put(self, indexes, values):
+        """Writes each value to its index, as a bulk version of __setitem__"""
+        blocks, owned = self.blocks, self.owned
+        for x, i in zip(indexes, values):
+            if x < 0:
+                x += self.length
+            block = x >> _COW_SHIFT
+            if not owned[block]:
+                blocks[block] = blocks[block].copy()
+                owned[block] = 1
+            blocks[block][x & _COW_MASK] = i
+
+    def putdata(self, iterable, option: int=0):
+        """Bulk version of NoneIsImportantTuple.putdata"""
+        values = list(self)
+        if option == 0:
+            iterable = iter(iterable)
+            for x, i in enumerate(values):
+                if i is None:
+                    continue
+                try:
+                    values[x] = next(iterable)
+                except StopIteration:
+                    break
+        elif option == 1:
+            for x, i in enumerate(islice(iterable, len(values))):
+                if i is not None:
+                    values[x] = i
+        self._write(0, values)
+
+    def copy(self):
+        self.owned = bytearray(len(self.blocks))
+        return self.__class__(self.blocks.copy(), self.length)
+
+    def reverse(self):
+        values = list(self)
+        values.reverse()
+        self._write(0, values)
+
+
+def _infer_bands(values):
+    for i in values:
+        if i is None or i is CanvasNone:
+            continue
+        return 1 if isinstance(i, int) else len(i)
+    raise ValueError('unable to infer bands without any pixels')
+
+
+def _pack(values, bands):
+    if bands == 1:
+        return bytes(values)
+    if values and set(map(len, values)) != {bands}:
+        raise ValueError('pixels must have {} bands'.format(bands))
+    return bytes(chain.from_iterable(values))
+
+
+class _TaggedTuple(tuple):
+    """A distinct copy of a pixel, so that it can be followed through a rearrange by identity"""
+
+
+class _TaggedInt(int):
+    """A distinct copy of a pixel, so that it can be followed through a rearrange by identity"""
+
+
+_TAGS = {tuple: _TaggedTuple, int: _TaggedInt}
+
+
+def _rearrangement(func, values):
+    """Rearranges values with func, recording where each one came from
+    :return: the rearranged values, and the index in values of each of them (or None)
+    """
+    argsort = getattr(func, 'argsort', None)
+    if argsort is not None:
+        permutation = argsort(values)
+        return [values[x] for x in permutation], permutation
+
+    try:
+        tagged = [_TAGS[type(i)](i) for i in values]
+    except KeyError:
+        return func(values), None
+
+    result = list(islice(func(tagged), len(values)))
+    indexes = {id(i): x for x, i in enumerate(tagged)}
+    permutation = [indexes.get(id(i)) for i in result]
+    # func may hand back copies, or the same pixel more than once (as sorters do with repeated colours),
+    # in which case equal colours are paired up in order instead
+    if len(permutation) != len(values) or None in permutation or len(set(permutation)) != len(values):
+        permutation = _match_colours(values, result)
+    if permutation is None:
+        return [_untagged(i) for i in result], None
+    return [values[x] for x in permutation], permutation
+
+
+def _untagged(value):
+    for plain, tagged in _TAGS.items():
+        if type(value) is tagged:
+            return plain(value)
+    return value
+
+
+def _match_colours(values, result):
+    """Returns the index in values of each of result, pairing up equal colours in order,
+    or None if result isn't a rearrangement of values
+    """
+    if len(result) != len(values):
+        return None
+    positions = {}
+    try:
+        for x, i in enumerate(values):
+            positions.setdefault(i, []).append(x)
+        positions = {i: iter(x) for i, x in positions.items()}
+        return [next(positions[i]) for i in result]
+    except (KeyError, StopIteration, TypeError):
+        return None
+
+
 class IndexableTuple(abc.Sequence):
     def __init__(self, data):
-        self.data = list(data)
+        if isinstance(data, IndexableTuple):
+            data = data._share()
+        self.data = data.copy() if isinstance(data, (PackedData, ViewData, CowData)) else list(data)
+
+    def _share(self):
+        """Returns the storage, moving a list into CowData first, so that copies of it are copy-on-write"""
+        if isinstance(self.data, list):
+            self.data = CowData.from_values(self.data)
+        return self.data
 
     def __len__(self):
         return len(self.data)
@@ -45,7 +641,7 @@ class IndexableTuple(abc.Sequence):
     def __getitem__(self, item):
         if item == _empty_slice:
             _copy = copy(self)
-            _copy.data = self.data[:]
+            _copy.data = self._share().copy()
             return _copy
         return self.data[item]
 
@@ -65,7 +661,9 @@ class NoneIsImportantTuple(IndexableTuple):
             1 = Will not jump past None
         :return:
         """
-        if option == 0:
+        if isinstance(self.data, (PackedData, ViewData, CowData)):
+            self.data.putdata(iterable, option)
+        elif option == 0:
             iterable = iter(iterable)
             for x, i in enumerate(self.data):
                 if i is None:
@@ -95,23 +693,56 @@ class NoneIsImportantTuple(IndexableTuple):
         yield from ((data, x) for data, x in zip(self.data, self.get_positions()) if data is not None)
 
     def getdata(self):
+        if self.is_packed:
+            return self.data.getdata()
         return [i for i in self.data if i is not None]
 
+    @property
+    def is_packed(self):
+        return isinstance(self.data, PackedData)
+
     @property
     def excluded(self):
         """Returns the index of excluded cells"""
+        if self.is_packed:
+            return self.data.excluded
         return [x for x, i in enumerate(self) if i is None]
 
     @property
     def unexcluded(self):
         """Returns the index of not excluded cells"""
+        if self.is_packed:
+            return self.data.unexcluded
         return [x for x, i in enumerate(self) if i is not None]
 
-    def rearrange(self, func):
-        self.putdata(func(self.getdata()))
+    @property
+    def bitmask(self):
+        """Returns the index of not excluded cells, packed into an int (see common.bitmask)"""
+        if self.is_packed:
+            cells = self.data.mask.translate(_IS_UNEXCLUDED)
+        else:
+            cells = bytes(map(is_not, self.data, repeat(None)))
+        return bitmask.from_cells(cells)
+
+    def rearrange(self, func, record: bool=False):
+        """
+        :param func: rearranges a list of the cells that aren't None
+        :param record: whether to work out where each of those cells moved to
+        :return: if recording, the previous index (within those cells) of each
+            rearranged cell, or None if func's result could not be followed
+        """
+        if not record:
+            self.putdata(func(self.getdata()))
+            return
+
+        values, permutation = _rearrangement(func, self.getdata())
+        self.putdata(values)
+        return permutation
 
     @property
     def is_redundant(self):
+        if self.is_packed:
+            return self.data.mask.count(_EXCLUDED) == len(self)
         return len(self.excluded) == len(self)
 
 
@@ -1,9 +1,17 @@
-from functools import wraps
+from functools import lru_cache, wraps
+from itertools import repeat
+from operator import add, mul
+import re
 
-from .BaseClasses import NoneIsImportantTuple, SizeInfo
+from .BaseClasses import NoneIsImportantTuple, SizeInfo, PackedData, ViewData, CowData, MappedBuffer
 from .common import *
 
 
+_PRESENT_RUNS = re.compile(b'\x01+')
+# Stands in for a default, so that None can be given as one
+_NO_DEFAULT = object()
+
+
 def _coord_convertor(func):
     @wraps(func)
     def wrapper(self, key, *args, **kwargs):
@@ -19,6 +27,13 @@ def _coord_convertor(func):
     return wrapper
 
 
+@lru_cache(maxsize=4)
+def _positions(size):
+    """The (x, y) of every cell, in order, shared between canvases of the same size"""
+    width, length = size
+    return tuple((x, y) for y in range(length) for x in range(width))
+
+
 class Canvas(NoneIsImportantTuple, SizeInfo):
     def __init__(self, data, size):
         NoneIsImportantTuple.__init__(self, data)
@@ -38,30 +53,164 @@ class Canvas(NoneIsImportantTuple, SizeInfo):
 
     @classmethod
     def from_canvas(cls, canvas):
-        return cls(canvas.data, canvas.size)
+        return cls(canvas, canvas.size)
+
+    @classmethod
+    def from_buffer(cls, buffer, size, bands: int=3, mask=None):
+        """Creates a packed canvas from raw pixel bytes, without building any tuples
+        :param buffer: bytes-like object holding width * length * bands bytes
+        :param mask: optional bytes-like object of PackedData states, one per cell
+        """
+        if len(buffer) != sili_math.prod(size) * bands:
+            raise ValueError('buffer does not match size')
+        canvas = cls([], size)
+        canvas.data = PackedData(bytearray(buffer), None if mask is None else bytearray(mask), bands)
+        return canvas
+
+    @classmethod
+    def from_file(cls, fp, size, bands: int=3):
+        """Creates a packed canvas over a file of raw pixel bytes, which is mapped into memory rather than read
+        Pixels are only read from disk as they're used, and changes go straight to the file,
+        so a canvas larger than memory can be worked through with Splitter.stream.
+        :param fp: path of a file holding width * length * bands bytes
+        """
+        with open(fp, 'r+b') as f:
+            buffer = MappedBuffer(f.fileno(), 0)
+        if len(buffer) != sili_math.prod(size) * bands:
+            buffer.close()
+            raise ValueError('file does not match size')
+        canvas = cls([], size)
+        # An anonymous map starts zeroed, every cell holding a value, and only takes memory where it's changed
+        canvas.data = PackedData(buffer, MappedBuffer(-1, sili_math.prod(size)), bands)
+        return canvas
+
+    def view(self, bbox):
+        """Returns a canvas of the region, which reads and writes straight through to this canvas
+        :param bbox: (x0, y0, x1, y1) inclusive corners, which may extend past this canvas
+        """
+        # Moved first, so that copying this canvas later doesn't move its storage out from under the view
+        data = ViewData(self._share(), self.size, bbox)
+        canvas = self.__class__([], data.size)
+        canvas.data = data
+        return canvas
+
+    @property
+    def is_view(self):
+        return isinstance(self.data, ViewData)
+
+    def pack(self, bands: int=None):
+        """Moves the pixels into contiguous storage
+        :param bands: bytes per pixel, inferred from the pixels if not given
+        :return: self
+        """
+        if not self.is_packed:
+            self.data = PackedData.from_values(self.data, bands)
+        return self
+
+    def unpack(self):
+        """Moves the pixels back into a list of tuples
+        :return: self
+        """
+        if self.is_packed:
+            self.data = list(self.data)
+        return self
 
     def as_grid(self):
-        return tuple(common.split_every(self.data, self.width))
+        data = list(self.data)
+        return tuple(data[x:x + self.width] for x in range(0, len(data), self.width))
 
     def insert(self, canvas, corner, raise_error=False):
-        if raise_error:
-            _c = Canvas.from_canvas(self)
-
-        for y, length in enumerate(canvas.as_grid(), corner[1]):
-            for x, width in enumerate(length, corner[0]):
-                if width is None:
-                    continue
-                try: self[(x, y)] = width
-                except IndexError:
-                    if raise_error:
-                        self.data = _c.data
-                        raise IndexError('new canvas does not fit into this canvas')
+        """Draws a canvas onto this canvas, skipping its None cells
+        Whole rows are copied at a time, clipped to this canvas.
+        :param corner: where the top left cell of canvas goes, which may be outside of this canvas
+        :param raise_error: whether to raise IndexError, without drawing anything,
+            when a cell that isn't None falls outside of this canvas
+        """
+        x0, y0 = corner
+        width, length = canvas.size
+        # The columns and rows of canvas that are within this canvas
+        left, right = min(max(-x0, 0), width), min(max(self.width - x0, 0), width)
+        top, bottom = min(max(-y0, 0), length), min(max(self.length - y0, 0), length)
+
+        if raise_error and (left, top, right, bottom) != (0, 0, width, length):
+            rows = (canvas.data[y * width:(y + 1) * width] for y in range(length))
+            outside = (row if not top <= y < bottom else row[:left] + row[right:] for y, row in enumerate(rows))
+            if any(i is not None for row in outside for i in row):
+                raise IndexError('new canvas does not fit into this canvas')
+
+        # Every row is read before any is written, in case canvas shares data with this canvas
+        rows = [canvas.data[y * width + left:y * width + right] for y in range(top, bottom)]
+        for y, row in enumerate(rows, y0 + top):
+            start = y * self.width + x0 + left
+            if None not in row:
+                self.data[start:start + len(row)] = row
+                continue
+            present = bytes(i is not None for i in row)
+            for match in _PRESENT_RUNS.finditer(present):
+                a, b = match.span()
+                self.data[start + a:start + b] = row[a:b]
 
     def data_and_positions(self):
         yield from ((data, x) for data, x in zip(self.data, self.get_positions()) if data is not None)
 
     def get_positions(self):
-        yield from [(x, y) for y in range(self.length) for x in range(self.width)]
+        yield from _positions(tuple(self.size))
+
+    def _indexes(self, keys):
+        """Converts keys to indexes of self.data
+        :param keys: (x, y) coordinates, or indexes
+        :return: the indexes, and whether each is within this canvas (or None when they all are)
+        """
+        keys = keys if isinstance(keys, (list, tuple)) else list(keys)
+        if not keys:
+            return keys, None
+
+        if isinstance(keys[0], int):
+            if -len(self) <= min(keys) and max(keys) < len(self):
+                return keys, None
+            return keys, [-len(self) <= x < len(self) for x in keys]
+
+        xs, ys = zip(*keys)
+        indexes = list(map(add, xs, map(mul, ys, repeat(self.width))))
+        if 0 <= min(xs) and max(xs) < self.width and 0 <= min(ys) and max(ys) < self.length:
+            return indexes, None
+        return indexes, [0 <= x < self.width and 0 <= y < self.length for x, y in keys]
+
+    def get_many(self, keys, default=_NO_DEFAULT):
+        """Reads many cells at once, without converting each coordinate through __getitem__
+        :param keys: (x, y) coordinates, or indexes, such as from get_positions
+        :param default: returned for keys outside of this canvas, which raise IndexError if not given
+        :return: list of the cells
+        """
+        indexes, within = self._indexes(keys)
+        if within is None:
+            return list(map(self.data.__getitem__, indexes))
+        if default is _NO_DEFAULT:
+            raise IndexError('canvas index out of range')
+        return [self.data[x] if inside else default for x, inside in zip(indexes, within)]
+
+    def set_many(self, keys, values, raise_error=True):
+        """Writes many cells at once, without converting each coordinate through __setitem__
+        Later keys win over earlier ones that are the same cell.
+        :param keys: (x, y) coordinates, or indexes
+        :param values: the value of each key
+        :param raise_error: whether to raise IndexError, without writing anything,
+            when a key is outside of this canvas, rather than skipping it
+        """
+        indexes, within = self._indexes(keys)
+        if within is not None and raise_error:
+            raise IndexError('canvas index out of range')
+
+        data = self.data
+        if within is None and isinstance(data, CowData):
+            data.put(indexes, values)
+        elif within is None:
+            for x, i in zip(indexes, values):
+                data[x] = i
+        else:
+            for x, i, inside in zip(indexes, values, within):
+                if inside:
+                    data[x] = i
 
     def copy(self):
         return self[:]
@@ -1,10 +1,38 @@
+from functools import lru_cache
+
 from . import Canvas
 from .common import *
 
+
+@lru_cache(maxsize=256)
+def _chain_mask(size, functions):
+    """The bitmask of the positions that functions, applied in turn to a grid of indexes, end up with
+    Cached, so a chain repeated over canvases of the same size is only run once
+    """
+    length = sili_math.prod(size)
+    grid = tuple(common.split_every(range(length), size[0]))
+    return bitmask.from_positions(common.flatten(common.flap(grid, functions)), length)
+
+
+def _positions_of(functions, size):
+    """The positions that Layer's set operations take functions to, for a canvas of size
+    :return: a bitmask, or indexes
+    """
+    if len(functions) == 1 and isinstance(functions[0], int):
+        return functions[0]
+    if len(functions) == 1 and hasattr(functions[0], 'mask'):
+        return functions[0].mask(size)
+    try:
+        hash(functions)
+    except TypeError:
+        return _chain_mask.__wrapped__(size, functions)
+    return _chain_mask(size, functions)
+
+
 class Comparer(Canvas):
     def __init__(self, canvas: Canvas or Type[Canvas]):
         self.c = canvas
-        super().__init__(self.c.data, self.c.size)
+        super().__init__(self.c, self.c.size)
 
     def unscope(self):
         raise NotImplemented()
@@ -24,62 +52,86 @@ class PositionalLayer(Comparer):
     def unscope(self):
         self.c.putdata(self, 1)
 
+    def _as_bitmask(self, positions):
+        if isinstance(positions, int):
+            return positions & bitmask.full(len(self.data))
+        return bitmask.from_positions(positions, len(self.data))
+
+    def _unexclude_bitmask(self, mask):
+        """Unexcludes every excluded cell in mask"""
+        for start, stop in bitmask.spans(mask & ~self.bitmask, len(self.data)):
+            self._copy_span(start, stop)
+
+    def _reset_to_bitmask(self, mask):
+        """Excludes every cell, then unexcludes the cells in mask"""
+        if self.is_packed:
+            self.data.exclude_all()
+        else:
+            self.data = [None] * len(self.data)
+        for start, stop in bitmask.spans(mask, len(self.data)):
+            self._copy_span(start, stop)
+
+    def _copy_span(self, start, stop):
+        if self.is_packed:
+            self.data.copy_from(self.c.data, start, stop)
+        else:
+            self.data[start:stop] = self.c.data[start:stop]
+
     def remove_excluded(self):
-        self.unexclude(range(len(self.data)))
+        self._unexclude_bitmask(bitmask.full(len(self.data)))
 
     def remove_unexcluded(self):
-        self.exclude(range(len(self.data)))
+        self._reset_to_bitmask(0)
 
     def difference(self, positions):
         """This allows the difference of different shapes and algorithms
         Ex: A circle & triangle, will have the area of where they don't overlap
+        :param positions: indexes, or a bitmask of them
         """
-        positions = set(self.unexcluded).difference(positions)
-        self.remove_unexcluded()
-        self.unexclude(positions)
+        self._reset_to_bitmask(self.bitmask & ~self._as_bitmask(positions))
 
     def union(self, positions):
         """This allows the mixing of different shapes and algorithms
         Ex: A circle & triangle, will have the area of both combined
+        :param positions: indexes, or a bitmask of them
         """
-        self.unexclude(set(self.unexcluded).union(positions))
+        self._unexclude_bitmask(self._as_bitmask(positions))
 
     def intersection(self, positions):
         """This allows the mixing of different shapes and algorithms
         Ex: A circle & triangle, will have the area of where they overlap
+        :param positions: indexes, or a bitmask of them
         """
-        positions = set(self.unexcluded).intersection(positions)
-        self.remove_unexcluded()
-        self.unexclude(positions)
+        self._reset_to_bitmask(self.bitmask & self._as_bitmask(positions))
 
     def invert(self):
-        unexcluded = self.unexcluded
-        self.remove_excluded()
-        self.exclude(unexcluded)
+        self._reset_to_bitmask(bitmask.full(len(self.data)) & ~self.bitmask)
 
 
 class Layer(PositionalLayer):
     # _iterable_remove_nested just makes function writing a bit more versatile
 
     def _apply_to(self, functions, attribute):
-        grid = tuple(common.split_every(range(len(self.c)), self.c.width))
-        getattr(super(), attribute)(common.flatten(common.flap(grid, functions)))
+        getattr(super(), attribute)(_positions_of(functions, self.c.size))
 
     def difference(self, *functions):
         """This allows the difference of different shapes and algorithms
         Ex: A circle & triangle, will have the area of where they don't overlap
+        :param functions: applied in turn to a grid of indexes, or a single bitmask
         """
         self._apply_to(functions, 'difference')
 
     def union(self, *functions):
         """This allows the mixing of different shapes and algorithms
         Ex: A circle & triangle, will have the area of both combined
+        :param functions: applied in turn to a grid of indexes, or a single bitmask
         """
         self._apply_to(functions, 'union')
 
     def intersection(self, *functions):
         """This allows the mixing of different shapes and algorithms
         Ex: A circle & triangle, will have the area of where they overlap
+        :param functions: applied in turn to a grid of indexes, or a single bitmask
         """
         self._apply_to(functions, 'intersection')
 
@@ -1,4 +1,5 @@
 from itertools import permutations
+import time
 
 from . import Canvas, Splitter
 from .BaseClasses import CanvasNone
@@ -64,33 +65,133 @@ class Merger:
         [splitter.canvases.append((canvas, corner)) for canvas, corner in zip(self.canvases, bbox0)]
         return splitter
 
-    def fill_in_canvas(self, canvas):
+    def fill_in_canvas(self, canvas, limit: int = None, timeout: float = None):
+        """Yields every exact fill of the canvas, placing each canvas in turn at the first empty cell
+        The layouts are searched once per distinct size, then each is yielded once for every
+        order the canvases of the same size can take in it.
+        :param limit: stop after this many fills
+        :param timeout: stop after this many seconds
+        """
         if sum(map(sili_math.prod, self.sizes)) != sili_math.prod(canvas.size):
             raise IndexError('canvases cannot fit in canvas')
 
-        _canvas = Canvas.from_empty_size(canvas.size, CanvasNone)
-
-        def get_empty_spot(c: Canvas):
-            for data, pos in c.data_and_positions():
-                if data is CanvasNone:
-                    return pos
-
-        for i in permutations(self.canvases):
-            temp = Canvas.from_canvas(_canvas)
-            try:
-                [temp.insert(j, get_empty_spot(temp), raise_error=True) for j in i]
-            except IndexError:
-                pass
-            else:
-                if CanvasNone not in temp:
-                    yield temp
-
-    def find_fill_in(self):
-        for length in common.unique_permutations(self.lengths):
-            length = sum(length)
-            for width in common.unique_permutations(self.widths):
-                width = sum(width)
+        # A None or CanvasNone cell can never be covered by the other canvases, as they fill the area exactly
+        if any(None in c or CanvasNone in c for c in self.canvases):
+            return
+
+        distinct = list(dict.fromkeys(self.sizes))
+        groups = [[c for c in self.canvases if c.size == size] for size in distinct]
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        fills = 0
+        for layout in _exact_layouts(canvas.size, distinct, [len(i) for i in groups], deadline):
+            for order in _orders(groups):
+                if limit is not None and fills >= limit or deadline is not None and time.monotonic() > deadline:
+                    return
+                pieces = [iter(i) for i in order]
+                temp = Canvas.from_empty_size(canvas.size, CanvasNone)
+                [temp.insert(next(pieces[i]), corner) for i, corner in layout]
+                fills += 1
+                yield temp
+
+    def find_fill_in(self, limit: int = None, timeout: float = None):
+        """
+        :param limit: stop after this many fills
+        :param timeout: stop after this many seconds
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for length in _subset_sums(self.lengths, deadline):
+            for width in _subset_sums(self.widths, deadline):
+                remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
                 try:
-                    yield from self.fill_in_canvas(Canvas.from_empty_size((width, length), default=CanvasNone))
+                    fills = self.fill_in_canvas(Canvas.from_empty_size((width, length), default=CanvasNone),
+                                                limit, remaining)
+                    for fill in fills:
+                        yield fill
+                        if limit is not None:
+                            limit -= 1
                 except IndexError:
                     pass
+                if limit == 0 or deadline is not None and time.monotonic() >= deadline:
+                    return
+
+
+def _exact_layouts(size, sizes, counts, deadline=None):
+    """Yields every way of tiling size exactly, always filling the first empty cell next
+    :param sizes: the distinct sizes of the tiles
+    :param counts: how many tiles there are of each size, which is used up as the search goes
+    :return: generator of layouts, [(index into sizes, corner), ...]
+    """
+    width, length = size
+    full = bitmask.full(width * length)
+    # The cells each size covers, when its corner is at (0, 0)
+    shapes = [sum(bitmask.full(w) << y * width for y in range(l)) for w, l in sizes]
+    dead_ends = set()
+    layout = []
+
+    def search(filled):
+        if filled == full:
+            yield list(layout)
+            return
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError
+        key = (filled, tuple(counts))
+        if key in dead_ends:
+            return
+
+        y, x = divmod((~filled & (filled + 1)).bit_length() - 1, width)
+        found = False
+        for i, (w, l) in enumerate(sizes):
+            if not counts[i] or x + w > width or y + l > length:
+                continue
+            shape = shapes[i] << x + y * width
+            if filled & shape:
+                continue
+            counts[i] -= 1
+            layout.append((i, (x, y)))
+            for result in search(filled | shape):
+                found = True
+                yield result
+            layout.pop()
+            counts[i] += 1
+
+        if not found:
+            dead_ends.add(key)
+
+    try:
+        yield from search(0)
+    except TimeoutError:
+        return
+
+
+def _orders(groups):
+    """Yields every order of each group, as product(*map(permutations, groups)) does,
+    without listing every permutation of a group before yielding the first
+    """
+    if not groups:
+        yield ()
+        return
+    for order in permutations(groups[0]):
+        for rest in _orders(groups[1:]):
+            yield (order, *rest)
+
+
+def _subset_sums(sizes, deadline=None):
+    """Yields every distinct sum of fewer than all of sizes, from the fewest sizes summed to the most
+    Each sum is worked out once, rather than once for every ordering of the sizes that make it
+    """
+    if not sizes:
+        return
+    # The sums of exactly r of the sizes, for every r below len(sizes)
+    sums = [{0}] + [set() for _ in sizes[1:]]
+    for size in sizes:
+        if deadline is not None and time.monotonic() > deadline:
+            return
+        for r in range(len(sums) - 1, 0, -1):
+            sums[r].update(x + size for x in sums[r - 1])
+
+    seen = set()
+    for r in sums:
+        for x in sorted(r - seen):
+            seen.add(x)
+            yield x
@@ -0,0 +1,222 @@
+from itertools import repeat
+from operator import add
+
+from .Canvas import Canvas
+from .Layer import Layer, _positions_of
+from .Splitter import Splitter, _overlapping
+from .common import *
+
+
+class Plan:
+    """Operations on the tiles of a canvas, recorded to be run later in one pass
+
+    As with Layer, the set operations and rearranges apply to the cells selected
+    since the last unscope or reverse, and a reverse flips the whole tile.
+    Intersection, difference, invert and remove_unexcluded take the cells from the
+    tile again, so they undo the rearranges before them that haven't been unscoped.
+    Ex: Plan(c).fragment((40, 40)).intersection(tools.triangle).rearrange(tools.yiq).run()
+        does the same as
+        splitter = Splitter(c)
+        for i in splitter.fragment((40, 40)):
+            layer = Layer(i)
+            layer.intersection(tools.triangle)
+            layer.rearrange(tools.yiq)
+            layer.unscope()
+        splitter.unscope_all()
+
+    When run, the selections are worked out once for each size of tile, with every
+    set operation folded into them, and each rearrange reads its cells straight from
+    the canvas and writes them straight back. No tile or layer is copied, and cells
+    that aren't rearranged are never read or written.
+    """
+    def __init__(self, canvas: Canvas, bbox=None):
+        """
+        :param bbox: (x0, y0, x1, y1) of the region to tile, as with Splitter.portion,
+            otherwise the whole canvas
+        """
+        self.c = canvas
+        self.bbox = bbox
+        self.tiling = None
+        self.steps = []
+
+    def _tile(self, tiling, *args):
+        self.tiling = tiling, args
+        return self
+
+    def _step(self, name, *args):
+        self.steps.append((name, args))
+        return self
+
+    def fragment(self, size, width_padding: int=0, length_padding: int=0):
+        return self._tile('fragment', size, width_padding, length_padding)
+
+    def fragment_fill_in(self, size, sizes_per_width: int, sizes_per_length: int):
+        return self._tile('fragment_fill_in', size, sizes_per_width, sizes_per_length)
+
+    def crack(self, sizes_per_width: int=1, sizes_per_length: int=1):
+        return self._tile('crack', sizes_per_width, sizes_per_length)
+
+    def reverse(self):
+        return self._step('reverse')
+
+    def unscope(self):
+        return self._step('unscope')
+
+    def intersection(self, *functions):
+        return self._step('intersection', *functions)
+
+    def union(self, *functions):
+        return self._step('union', *functions)
+
+    def difference(self, *functions):
+        return self._step('difference', *functions)
+
+    def invert(self):
+        return self._step('invert')
+
+    def remove_excluded(self):
+        return self._step('remove_excluded')
+
+    def remove_unexcluded(self):
+        return self._step('remove_unexcluded')
+
+    def rearrange(self, func):
+        return self._step('rearrange', func)
+
+    def shape_and_rearrange(self, shape_func, rearrange_func):
+        return self.intersection(shape_func).rearrange(rearrange_func).remove_excluded()
+
+    def _region(self):
+        """(x0, y0, width, length) of the region being tiled"""
+        if self.bbox is None:
+            return (0, 0, *self.c.size)
+        x0, y0, x1, y1 = self.bbox
+        return x0, y0, max(0, x1 - x0 + 1), max(0, y1 - y0 + 1)
+
+    def _bboxes(self):
+        x0, y0, width, length = self._region()
+        if self.tiling is None:
+            return [(0, 0, width - 1, length - 1)]
+        splitter = Splitter(Canvas([], (width, length)))
+        tilings = {'fragment': splitter._fragment_bboxes,
+                   'fragment_fill_in': splitter._fragment_fill_in_bboxes,
+                   'crack': splitter._crack_bboxes}
+        tiling, args = self.tiling
+        return list(tilings[tiling](*args))
+
+    def run(self, fuse: bool=True):
+        """Carries out the plan on the canvas
+        :param fuse: whether to run it in one pass, which needs tiles that don't overlap
+            and a plan that ends the right way round; otherwise it's run through Splitter and Layer
+        :return: the canvas
+        """
+        bboxes = self._bboxes()
+        if not fuse or self._flipped() or _overlapping(bboxes, self._region()[2:]):
+            self._run_unfused()
+        else:
+            self._run_fused(bboxes)
+        return self.c
+
+    def _flipped(self):
+        return sum(name == 'reverse' for name, _ in self.steps) % 2 == 1
+
+    def _run_unfused(self):
+        splitter = Splitter(self.c)
+        region = splitter.portion(self.bbox) if self.bbox is not None else self.c
+        tiler = Splitter(region)
+        tiles = [region] if self.tiling is None else getattr(tiler, self.tiling[0])(*self.tiling[1])
+
+        for tile in tiles:
+            layer = None
+            for name, args in self.steps:
+                if name in ('reverse', 'unscope'):
+                    if layer is not None:
+                        layer.unscope()
+                        layer = None
+                    if name == 'reverse':
+                        tile.reverse()
+                    continue
+                if layer is None:
+                    layer = Layer(tile)
+                getattr(layer, name)(*args)
+            if layer is not None:
+                layer.unscope()
+
+        tiler.unscope_all()
+        splitter.unscope_all()
+
+    def _compile(self, size):
+        """Works out the cells of each rearrange within a tile of size
+        :return: [(indexes within the tile, in the order they're rearranged, func), ...]
+        """
+        n = sili_math.prod(size)
+        full = bitmask.full(n)
+        program = []
+        selected, flipped = full, False
+        # Where the current layer's rearranges start in program
+        layer = 0
+
+        for name, args in self.steps:
+            if name in ('reverse', 'unscope'):
+                selected, layer = full, len(program)
+                flipped ^= name == 'reverse'
+            elif name == 'rearrange':
+                cells = bitmask.positions(selected, n)
+                program.append(([n - 1 - x for x in cells] if flipped else cells, args[0]))
+            elif name == 'remove_excluded':
+                selected = full
+            elif name == 'union':
+                selected |= self._mask(args, size)
+            else:
+                # These take the layer's cells from the tile again, so its rearranges so far are lost
+                del program[layer:]
+                selected = {'intersection': lambda: selected & self._mask(args, size),
+                            'difference': lambda: selected & ~self._mask(args, size),
+                            'invert': lambda: full & ~selected,
+                            'remove_unexcluded': lambda: 0}[name]()
+        return program
+
+    @staticmethod
+    def _mask(functions, size):
+        positions = _positions_of(functions, size)
+        n = sili_math.prod(size)
+        if isinstance(positions, int):
+            return positions & bitmask.full(n)
+        return bitmask.from_positions(positions, n)
+
+    def _run_fused(self, bboxes):
+        region_x, region_y, region_width, region_length = self._region()
+        width, length = self.c.size
+        programs = {}
+
+        for x0, y0, x1, y1 in bboxes:
+            size = x1 - x0 + 1, y1 - y0 + 1
+            if size not in programs:
+                programs[size] = [(cells, func, _offsets(cells, size, width))
+                                  for cells, func in self._compile(size)]
+            if not programs[size]:
+                continue
+
+            # The columns and rows of the tile that are within both the region and the canvas
+            left = max(0, -x0, -(region_x + x0))
+            right = min(size[0], region_width - x0, width - (region_x + x0))
+            top = max(0, -y0, -(region_y + y0))
+            bottom = min(size[1], region_length - y0, length - (region_y + y0))
+            corner = (region_x + x0) + (region_y + y0) * width
+
+            for cells, func, offsets in programs[size]:
+                if (left, top, right, bottom) == (0, 0, *size):
+                    indexes = list(map(add, repeat(corner), offsets))
+                else:
+                    indexes = [corner + offset for x, offset in zip(cells, offsets)
+                               if left <= x % size[0] < right and top <= x // size[0] < bottom]
+                values = self.c.get_many(indexes)
+                if None in values:
+                    indexes = [x for x, i in zip(indexes, values) if i is not None]
+                    values = [i for i in values if i is not None]
+                self.c.set_many(indexes, func(values))
+
+
+def _offsets(cells, size, width):
+    """The offset of each tile cell from the tile's top left cell, within a canvas of width"""
+    return [x % size[0] + x // size[0] * width for x in cells]
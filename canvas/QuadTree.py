@@ -2,29 +2,84 @@ import colorsys
 import math
 import pprint
 import time
-import statistics
+from array import array
 from collections import Counter
+from itertools import accumulate, chain, islice
+from operator import add, itemgetter, mul
 import random
 
 from canvas import *
+from canvas.common import line_thingy
 
 
 def dist(a, b):
     return math.sqrt(sum((a - b) ** 2 for a, b in zip(a, b)))
 
 
+class _SummedArea:
+    """Summed-area tables of every band of a canvas, and of their squares,
+    which give the sum over any region in constant time
+    """
+    def __init__(self, c: Canvas):
+        self.width, self.length = c.size
+        self.bands = len(c.data[0])
+        stride = self.width + 1
+        # Each table starts with a row of zeros, above the first row of the canvas
+        self.sums = [array('q', [0]) * stride for _ in range(self.bands)]
+        self.squares = [array('q', [0]) * stride for _ in range(self.bands)]
+
+        data = iter(c.data)
+        for _ in range(self.length):
+            row = list(islice(data, self.width))
+            for band, (sums, squares) in enumerate(zip(self.sums, self.squares)):
+                values = list(map(itemgetter(band), row))
+                sums.extend(map(add, sums[-stride:], chain((0,), accumulate(values))))
+                squares.extend(map(add, squares[-stride:], chain((0,), accumulate(map(mul, values, values)))))
+
+    def _region(self, table, bbox):
+        x0, y0, x1, y1 = bbox
+        stride = self.width + 1
+        top, bottom = y0 * stride, (y1 + 1) * stride
+        return table[bottom + x1 + 1] - table[bottom + x0] - table[top + x1 + 1] + table[top + x0]
+
+    def mean(self, bbox):
+        count = (bbox[2] - bbox[0] + 1) * (bbox[3] - bbox[1] + 1)
+        return tuple(self._region(table, bbox) // count for table in self.sums)
+
+    def variance(self, bbox):
+        """The variance of each band in the region, added together"""
+        count = (bbox[2] - bbox[0] + 1) * (bbox[3] - bbox[1] + 1)
+        return sum((count * self._region(squares, bbox) - self._region(sums, bbox) ** 2) / count ** 2
+                   for sums, squares in zip(self.sums, self.squares))
+
+
 class QuadTree:
-    def __init__(self, template: Canvas, id, depth=1):
+    __slots__ = ('id', 'colour', 'children', 'depth', 'bbox', 'traversed', 'distance_from_parent', 'point')
+
+    def __init__(self, colour, id, depth=1, bbox=None):
         self.id = id
-        self.colour = None
+        self.colour = colour
         self.children = None
-        self.template = template
         self.depth = depth
-        self.parse_colour()
+        self.bbox = bbox  # (x0, y0, x1, y1) inclusive corners of the region the node covers
         self.traversed = False
         self.distance_from_parent = 0
         self.point = False
 
+    @classmethod
+    def grow(cls, c: Canvas, max_depth: int=6, threshold: float=None):
+        """Builds the tree of a canvas, where each node's children are the quarters of its region
+        :param max_depth: depth of the leaves, where the root is at 1
+        :param threshold: regions whose variance, added up over the bands, isn't above this aren't split
+        :return: the root
+        """
+        table = _SummedArea(c)
+        bbox = (0, 0, c.width - 1, c.length - 1)
+        seed = cls(table.mean(bbox), 0, bbox=bbox)
+        if not seed.zoom(table, max_depth, threshold):
+            raise line_thingy.RangeError
+        return seed
+
     @property
     def total_distance_from_parent(self):
         if self.children:
@@ -32,31 +87,35 @@ class QuadTree:
         else:
             return self.distance_from_parent
 
-    def parse_colour(self):
-        bands = zip(*self.template)
-        self.colour = tuple(int(statistics.mean(i)) for i in bands)
+    def zoom(self, table: _SummedArea, max_depth: int=6, threshold: float=None):
+        """Splits the node recursively
+        Stops at children of the first quarter that can't be split any further, keeping the ones before it
+        :return: False when the node is too small to be split
+        """
+        if self.depth == max_depth or threshold is not None and table.variance(self.bbox) <= threshold:
+            return True
+
+        x0, y0, x1, y1 = self.bbox
+        width, length = x1 - x0 + 1, y1 - y0 + 1
+        if width < 2 or length < 2:
+            return False
+
+        # Quarters in the order of Splitter.crack(2, 2), the first row and column taking any extra cell
+        xs = ((x0, x0 + (width + 1) // 2 - 1), (x0 + (width + 1) // 2, x1))
+        ys = ((y0, y0 + (length + 1) // 2 - 1), (y0 + (length + 1) // 2, y1))
+        bboxes = [(cx0, cy0, cx1, cy1) for cy0, cy1 in ys for cx0, cx1 in xs]
+        self.children = [self.__class__(table.mean(bbox), x, self.depth + 1, bbox) for x, bbox in enumerate(bboxes)]
 
-    def zoom(self):
         went_further = False
-
-        if self.depth != 6:  # Important number
-            self.parse_children()
-            for child in self.children:
-                child.distance_from_parent = dist(self.colour, child.colour)
-                try:
-                    child.zoom()
-                except:
-                    break
-                else:
-                    went_further = True
+        for child in self.children:
+            child.distance_from_parent = dist(self.colour, child.colour)
+            if not child.zoom(table, max_depth, threshold):
+                break
+            went_further = True
 
         if not went_further:
             self.children = None
-        self.template = None
-
-    def parse_children(self):
-        splitter = Splitter(self.template)
-        self.children = [QuadTree(i, x, depth=self.depth + 1) for x, i in enumerate(splitter.crack(2, 2))]
+        return True
 
     def print(self, prefix=''):
         if self.children:
@@ -66,50 +125,55 @@ class QuadTree:
 
 
 class Seedling:
-    def __init__(self, c: Canvas):
-        self.seed = QuadTree(c, 0)
-        self.seed.zoom()
+    def __init__(self, c: Canvas, max_depth: int=6, threshold: float=None):
+        """
+        :param max_depth: depth of the tree's leaves, where the root is at 1
+        :param threshold: regions whose colour varies less than this aren't split, see QuadTree.grow
+        """
+        self.seed = QuadTree.grow(c, max_depth, threshold)
         self.c = Canvas.from_empty_size(c.size, self.seed.colour)
         self._c = c
 
     def unscope(self):
         self._c.pudata(self.c)
 
-    def _navigate(self, template, nav, branch=None):
-        # There is significant slowness when constantly splitting the canvas.
-        #     Caching high regions of activity would be effective.
+    def _paint(self, node: QuadTree):
+        """Draws the node's region straight into the canvas, its colour framed in black"""
+        x0, y0, x1, y1 = node.bbox
+        width = x1 - x0 + 1
+        edge = [(0, 0, 0)] * width
+        middle = [(0, 0, 0)] + [node.colour] * (width - 2) + [(0, 0, 0)] if width > 2 else edge
+
+        for y in range(y0, y1 + 1):
+            start = x0 + y * self.c.width
+            self.c.data[start:start + width] = edge if y in (y0, y1) else middle
+
+    def _navigate(self, nav, branch=None):
         if branch is None:
             branch = self.seed
+            x0, y0, x1, y1 = branch.bbox
+            if x1 == x0 or y1 == y0:
+                raise line_thingy.RangeError
 
-        splitter = Splitter(template)
-        te = [i for i in splitter.crack(2, 2)]
-
-        t, i = te[nav[0]], branch.children[nav[0]]
+        i = branch.children[nav[0]]
 
-        for tr, ir in zip(te, branch.children):
-            if ir.traversed:
-                continue
-            else:
-                res = [(0, 0, 0)] * tr.width
-                [res.extend([(0, 0, 0)] + [ir.colour] * (tr.width - 2) + [(0, 0, 0)]) for _ in range(tr.length - 2)]
-                res.extend([(0, 0, 0)] * tr.width)
-                tr.putdata(res)
+        for ir in branch.children:
+            if not ir.traversed:
+                self._paint(ir)
                 ir.traversed = True
 
         if i.children and nav[1:]:
             try:
-                self._navigate(t, nav[1:], i)
+                self._navigate(nav[1:], i)
             except:
                 i.point = True
         else:
             i.point = True
 
-        splitter.unscope_all()
-
     def nav_location(self, pathway=None, max_depth=8):
         if pathway is None:
             pathway = [random.randint(0, 3) for _ in range(random.randint(max_depth-2, max_depth))]
-        return self._navigate(self.c, pathway)
+        return self._navigate(pathway)
 
     def nav_importance(self, max_depth=8):
         def gather_distances(branch, nav=None):
@@ -129,22 +193,13 @@ class Seedling:
 
 
 def example(canvas):
-    sequence = []
     seed = Seedling(canvas)
-    for i in range(100):
-        now = time.time()
-        print(i)
-        seed.nav_importance(10)
-        sequence.append(seed.c.as_PIL('RGB'))
-        print('{:0.2f}'.format(time.time() - now))
-
-
-    duration = [250] + [3 for _ in range(len(sequence) - 2)] + [250]
-    sequence[0].save('result.gif',
-                     format="gif",
-                     save_all=True,
-                     append_images=sequence[1:],
-                     duration=duration,
-                     loop=0)
+    with Canvas.frame_sink('result.gif', 'RGB', loop=0) as sink:
+        for i in range(100):
+            now = time.time()
+            print(i)
+            seed.nav_importance(10)
+            sink.write(seed.c, duration=250 if i in (0, 99) else 3)
+            print('{:0.2f}'.format(time.time() - now))
 
     return seed.c
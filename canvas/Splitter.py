@@ -1,18 +1,25 @@
 from typing import Type
+import multiprocessing
+import os
 
 from . import Canvas
 from .common import *
-from .BaseClasses import SizeInfo
+from .BaseClasses import SizeInfo, PackedData
 
 
 class Splitter(SizeInfo):
     """Allows the creation of canvases within a canvas
     Which can allow tessellation or fractal patterns
+
+    With views, every portion reads and writes straight through to the canvas
+    instead of being a copy, so nothing needs writing back when unscoping.
+    Overlapping portions then see each other's changes immediately.
     """
-    def __init__(self, canvas):
+    def __init__(self, canvas, views: bool=False):
         self.c = canvas
         super().__init__(self.c.size)
         self.canvases = []
+        self.views = views
 
     def bbox_is_outside_range(self, bbox):
         x0, x1, y0, y1 = bbox
@@ -30,22 +37,17 @@ class Splitter(SizeInfo):
         x0, y0, x1, y1 = bbox
 
         size = x1 - x0 + 1, y1 - y0 + 1
-        canvas = self.c.__class__.from_empty_size(size)
+        canvas = self.c.__class__(self.c.get_many(sili_math.positions_within(bbox), default=None), size)
         self.canvases.append((canvas, bbox[:2]))
 
-        positions = []
-        for pos in sili_math.positions_within(bbox):
-            try:
-                i = self.c[pos]
-            except IndexError:
-                i = None
-
-            positions.append(i)
-        canvas.putdata(positions)
-
         return canvas
 
     def portion(self, bbox) -> Type[Canvas]:
+        if self.views:
+            canvas = self.c.view(bbox)
+            self.canvases.append((canvas, bbox[:2]))
+            return canvas
+
         if self.bbox_is_outside_range:
             return self._outside_range(bbox)
 
@@ -54,37 +56,227 @@ class Splitter(SizeInfo):
         self.canvases.append((canvas, bbox[:2]))
         return canvas
 
+    def _is_view(self, canvas):
+        return canvas.is_view and canvas.data.parent is self.c.data
+
     def unscope(self, idx):
-        self.c.insert(*self.canvases.pop(idx))
+        canvas, corner = self.canvases.pop(idx)
+        if not self._is_view(canvas):
+            self.c.insert(canvas, corner)
 
     def unscope_all(self):
-        [self.unscope(0) for _ in range(len(self.canvases))]
+        canvases, self.canvases = self.canvases, []
+        for canvas, corner in canvases:
+            if not self._is_view(canvas):
+                self.c.insert(canvas, corner)
 
     def get_canvases(self):
         yield from self.canvases
 
-    def _portion_from_rangeable(self, size, x_positions, y_positions):
+    def _bboxes_from_rangeable(self, size, x_positions, y_positions):
         for j, y_pos in enumerate(y_positions):
             for x_pos in x_positions:
                 bbox0 = x_pos, y_pos
                 bbox1 = sili_math.get_opposite_corner(bbox0, size)
-                yield self.portion((*bbox0, *bbox1))
+                yield (*bbox0, *bbox1)
 
-    def fragment(self, size, width_padding: int=0, length_padding: int=0):
+    def _fragment_bboxes(self, size, width_padding: int=0, length_padding: int=0):
         x_positions = [*line_thingy.padded_maximum(self.width, width_padding, size[0])]
         y_positions = line_thingy.padded_maximum(self.length, length_padding, size[1])
-        yield from self._portion_from_rangeable(size, x_positions, y_positions)
+        yield from self._bboxes_from_rangeable(size, x_positions, y_positions)
 
-    def fragment_fill_in(self, size, sizes_per_width: int, sizes_per_length: int):
+    def _fragment_fill_in_bboxes(self, size, sizes_per_width: int, sizes_per_length: int):
         x_positions = [*line_thingy.fill_in_shortcut(self.width, size[0], sizes_per_width)]
         y_positions = line_thingy.fill_in_shortcut(self.length, size[1], sizes_per_length)
-        yield from self._portion_from_rangeable(size, x_positions, y_positions)
+        yield from self._bboxes_from_rangeable(size, x_positions, y_positions)
 
-    def crack(self, sizes_per_width: int=1, sizes_per_length: int=1):
+    def _crack_bboxes(self, sizes_per_width: int=1, sizes_per_length: int=1):
         x_positions = [*line_thingy.find_fill_in(self.width, sizes_per_width)]
         y_positions = line_thingy.find_fill_in(self.length, sizes_per_length)
         for y_pos, length in y_positions:
             for x_pos, width in x_positions:
                 bbox0 = x_pos, y_pos
                 bbox1 = sili_math.get_opposite_corner(bbox0, (width, length))
-                yield self.portion((*bbox0, *bbox1))
+                yield (*bbox0, *bbox1)
+
+    def fragment(self, size, width_padding: int=0, length_padding: int=0):
+        yield from map(self.portion, self._fragment_bboxes(size, width_padding, length_padding))
+
+    def fragment_fill_in(self, size, sizes_per_width: int, sizes_per_length: int):
+        yield from map(self.portion, self._fragment_fill_in_bboxes(size, sizes_per_width, sizes_per_length))
+
+    def crack(self, sizes_per_width: int=1, sizes_per_length: int=1):
+        yield from map(self.portion, self._crack_bboxes(sizes_per_width, sizes_per_length))
+
+    def map(self, recipe, tiling: str, *args, processes: int=None, **kwargs):
+        """Applies recipe to every tile of a tiling, on a pool of processes
+
+        The canvas is shared with the processes through shared memory, and each
+        process copies its tiles in and writes them back itself, like unscope.
+        Ex: splitter.map(sort_triangle, 'fragment', (40, 40))
+            does the same as
+            for tile in splitter.fragment((40, 40)):
+                sort_triangle(tile)
+            splitter.unscope_all()
+        :param recipe: changes a tile in place, which has to be picklable,
+            so defined at the top level of a module
+        :param tiling: 'fragment', 'fragment_fill_in' or 'crack', whose arguments follow,
+            and whose tiles cannot overlap as the processes would race to write them
+        :return: what recipe returns for each tile, in order
+        """
+        tilings = {'fragment': self._fragment_bboxes,
+                   'fragment_fill_in': self._fragment_fill_in_bboxes,
+                   'crack': self._crack_bboxes}
+        bboxes = list(tilings[tiling](*args, **kwargs))
+        if _overlapping(bboxes, self.size):
+            raise ValueError('tiles cannot overlap when mapped to processes')
+
+        from multiprocessing import shared_memory  # Python 3.8+, so only needed once map is used
+
+        data = self.c.data if self.c.is_packed else PackedData.from_values(self.c.data)
+        n = len(data)
+        memory = shared_memory.SharedMemory(create=True, size=max(1, n * (data.bands + 1)))
+        try:
+            memory.buf[:n * data.bands] = data.buffer
+            memory.buf[n * data.bands:n * (data.bands + 1)] = data.mask
+
+            processes = processes or os.cpu_count()
+            chunksize = max(1, len(bboxes) // (processes * 4))
+            tasks = ((recipe, self.c.__class__, bbox) for bbox in bboxes)
+            with multiprocessing.Pool(processes, _attach_shared,
+                                      (memory.name, self.size, data.bands)) as pool:
+                results = list(pool.imap(_apply_to_tile, tasks, chunksize))
+
+            data.buffer[:] = memory.buf[:n * data.bands]
+            data.mask[:] = memory.buf[n * data.bands:n * (data.bands + 1)]
+        finally:
+            memory.close()
+            memory.unlink()
+
+        if not self.c.is_packed:
+            self.c.putdata(data, 1)
+        return results
+
+    def stream(self, recipe, size, width_padding: int=0, length_padding: int=0):
+        """Applies recipe to every tile of a fragment tiling, one band of rows at a time
+
+        Only the rows of the current band are held in memory, and they are written
+        back before the next band is read, so a canvas from Canvas.from_file is
+        worked through without ever being read in whole.
+        Ex: splitter.stream(sort_triangle, (40, 40))
+            does the same as
+            for tile in splitter.fragment((40, 40)):
+                sort_triangle(tile)
+            splitter.unscope_all()
+        :param recipe: changes a tile in place
+        :return: what recipe returns for each tile, in order
+        """
+        if length_padding < 0:
+            raise ValueError('bands of tiles cannot overlap when streaming')
+
+        results = []
+        for y in line_thingy.padded_maximum(self.length, length_padding, size[1]):
+            band = self._read_rows(y, min(size[1], self.length - y))
+            splitter = self.__class__(band, self.views)
+            results.extend(map(recipe, splitter.fragment(size, width_padding, length_padding)))
+            splitter.unscope_all()
+            self._write_rows(y, band)
+        return results
+
+    def _read_rows(self, y, rows):
+        start, stop = y * self.width, (y + rows) * self.width
+        band = self.c.__class__([], (self.width, rows))
+        if self.c.is_packed:
+            data, bands = self.c.data, self.c.data.bands
+            band.data = PackedData(bytearray(data.buffer[start * bands:stop * bands]),
+                                   bytearray(data.mask[start:stop]), bands)
+        else:
+            band.data = list(self.c.data[start:stop])
+        return band
+
+    def _write_rows(self, y, band):
+        start, stop = y * self.width, y * self.width + len(band)
+        data = self.c.data
+        if self.c.is_packed and band.is_packed and band.data.bands == data.bands:
+            bands = data.bands
+            data.buffer[start * bands:stop * bands] = band.data.buffer
+            data.mask[start:stop] = band.data.mask
+            if hasattr(data.buffer, 'flush'):
+                data.buffer.flush()  # Written out as it goes when mapped to a file
+        else:
+            data[start:stop] = list(band.data)
+
+
+def _overlapping(bboxes, size):
+    """Whether any of the bboxes share a cell within a region of size"""
+    width, length = size
+    covered = bytearray(width * length)
+    for x0, y0, x1, y1 in bboxes:
+        left, right = max(x0, 0), min(x1 + 1, width)
+        if left >= right:
+            continue
+        for y in range(max(y0, 0), min(y1 + 1, length)):
+            start = y * width
+            if 1 in covered[start + left:start + right]:
+                return True
+            covered[start + left:start + right] = bytes([1]) * (right - left)
+    return False
+
+
+# The shared canvas, attached to once by each process of Splitter.map
+_shared = None
+
+
+def _attach_shared(name, size, bands):
+    from multiprocessing import shared_memory
+
+    global _shared
+    memory = shared_memory.SharedMemory(name=name)
+    n = sili_math.prod(size)
+    _shared = memory, size, memory.buf[:n * bands], memory.buf[n * bands:n * (bands + 1)], bands
+
+
+def _tile_rows(size, bbox):
+    """
+    :return: (row of the tile, first column of the tile, parent index, cells) for
+        every row of the tile within a canvas of size
+    """
+    width, length = size
+    x0, y0, x1, y1 = bbox
+    first, last = max(x0, 0), min(x1 + 1, width)
+    if first >= last:
+        return
+    for y in range(max(y0, 0), min(y1 + 1, length)):
+        yield y - y0, first - x0, y * width + first, last - first
+
+
+def _apply_to_tile(task):
+    recipe, cls, bbox = task
+    memory, size, buffer, mask, bands = _shared
+    x0, y0, x1, y1 = bbox
+    tile_width, tile_length = x1 - x0 + 1, y1 - y0 + 1
+
+    # Cells outside of the shared canvas start as None, as they do with Splitter.portion
+    data = PackedData(bytearray(tile_width * tile_length * bands),
+                      bytearray([1]) * (tile_width * tile_length), bands)
+    rows = list(_tile_rows(size, bbox))
+    for y, x, position, cells in rows:
+        start = y * tile_width + x
+        data.buffer[start * bands:(start + cells) * bands] = buffer[position * bands:(position + cells) * bands]
+        data.mask[start:start + cells] = mask[position:position + cells]
+
+    tile = cls([], (tile_width, tile_length))
+    tile.data = data
+    result = recipe(tile)
+    if not tile.is_packed:
+        tile.pack(bands)
+
+    # Writes back everything but None, like Canvas.insert
+    for y, x, position, cells in rows:
+        start = y * tile_width + x
+        row = PackedData(tile.data.buffer[start * bands:(start + cells) * bands],
+                         tile.data.mask[start:start + cells], bands)
+        for a, b in row.unexcluded_spans():
+            buffer[(position + a) * bands:(position + b) * bands] = row.buffer[a * bands:b * bands]
+            mask[position + a:position + b] = row.mask[a:b]
+    return result
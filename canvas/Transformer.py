@@ -1,3 +1,5 @@
+from operator import eq
+import math
 from typing import Type, Tuple
 
 from . import Canvas
@@ -10,16 +12,43 @@ from .tools.geometry import TwoDimensional
 class Tracker(Comparer):
     def __init__(self, canvas: Type[Comparer]):
         super().__init__(canvas)
+        # The index in self.c of every cell that isn't None, as recorded by rearrange
+        self.origins = self.unexcluded
+
+    def rearrange(self, func):
+        permutation = super().rearrange(func, record=True)
+        if permutation is None or self.origins is None:
+            self.origins = None
+        else:
+            self.origins = [self.origins[x] for x in permutation]
+        return permutation
+
+    def _origins_hold(self):
+        """Whether the recorded origins still lead to the current cells"""
+        if self.origins is None:
+            return False
+        data = self.getdata()
+        return len(self.origins) == len(data) and all(map(eq, map(self.c.data.__getitem__, self.origins), data))
 
     def how_did_it_transform(self):
         """Gets the indexes of the new array as inplace indexes of the current image
 
         This only works when both states are unchanged with data and size.
             Order of data does not matter
+        Uses the movements recorded by rearrange when they still hold,
+            otherwise pairs up equal colours in order
         """
+        if self._origins_hold():
+            positions = list(self.get_positions())
+            sequence = [None] * len(self)
+            for x, origin in zip(self.unexcluded, self.origins):
+                sequence[x] = positions[origin]
+            return Canvas(sequence, self.size)
+
         items = {i: [] for i in set(self.c)}
         [items[i].append(x) for x, i in zip(self.get_positions(), self.c)]
-        sequence = [items[i].pop(0) if i is not None else None for i in self]
+        items = {i: iter(positions) for i, positions in items.items()}
+        sequence = [next(items[i]) if i is not None else None for i in self]
         return Canvas(sequence, self.size)
 
     def movement(self, function):
@@ -56,33 +85,129 @@ class Constructor:
 
     def intercept(self, intercept: float, overwrite_template = False, insert_canvas: Canvas = None) -> Canvas:
         template = Canvas.from_canvas(self.template)
-        for x, transform in zip(self._gen_pathway(intercept), self._gen_transform(intercept)):
-            if None not in (x, transform):
-                if insert_canvas:
-                    transform = insert_canvas.copy().replace(CanvasNone, transform)
-                    template.insert(transform, x)
-                else:
-                    template[x] = transform
+        pairs = [(x, transform) for x, transform in zip(self._gen_pathway(intercept), self._gen_transform(intercept))
+                 if None not in (x, transform)]
+        if insert_canvas:
+            for x, transform in pairs:
+                transform = insert_canvas.copy().replace(CanvasNone, transform)
+                template.insert(transform, x)
+        elif pairs:
+            template.set_many(*zip(*pairs))
 
         if overwrite_template:
             self.template = template
         return template
 
-    def voronoi(self, intercept: float, nearest_neighbour_function = TwoDimensional.circle_from_point, overwrite_template = False) -> Canvas:
+    def frames(self, intercepts, insert_canvas: Canvas = None):
+        """Yields the intercept of each value, drawn onto one canvas that is reused between frames
+        Only the pixels whose position or colour changed since the previous frame are redrawn,
+        so the cost of a frame follows the motion in it rather than the size of the canvas.
+        :param intercepts: iterable of intercept values, such as [x / 30 for x in range(31)]
+        :param insert_canvas: as with intercept
+        :return: generator of the same canvas, which only holds a frame until the next is requested
+        """
+        frame = Canvas.from_canvas(self.template)
+        background = list(frame.data)
+        width, length = frame.size
+
+        # The cells drawn by a pixel, as offsets from its position, and CanvasNone where it draws its colour
+        if insert_canvas is None:
+            stamp = [((0, 0), CanvasNone)]
+        else:
+            stamp = [(x, data) for data, x in insert_canvas.data_and_positions()]
+
+        pathways = None if self.pathways is None else list(self.pathways)
+        transforms = None if self.transforms is None else list(self.transforms)
+        positions = list(self._gen_pathway(0)) if pathways is None else pathways
+        colours = list(self._gen_transform(0)) if transforms is None else transforms
+
+        # Pixels move in step with every other pixel whose pathway and transform have the same lengths
+        groups = {}
+        for i, (pathway, transform) in enumerate(zip(positions, colours)):
+            if None in (pathway, transform):
+                continue
+            key = (None if pathways is None else len(pathway), None if transforms is None else len(transform))
+            groups.setdefault(key, []).append(i)
+
+        steps = {}
+        drawn = [None] * len(positions)  # the position and colour each pixel is drawn with
+        # Each cell of a pixel's stamp is drawn as its own unit, numbered in the order intercept draws them
+        at = [None] * (len(positions) * len(stamp))
+        shown = [None] * len(at)
+        occupants = [set() for _ in background]  # the units on each cell, where the latest is the one shown
+
+        for intercept in intercepts:
+            dirty = set()
+            for key, pixels in groups.items():
+                step = tuple(None if n is None else common.intercept(intercept, range(n)) for n in key)
+                if steps.get(key) == step:
+                    continue
+                steps[key] = step
+
+                p, t = step
+                for i in pixels:
+                    x = positions[i] if p is None else positions[i][p]
+                    colour = colours[i] if t is None else colours[i][t]
+                    if drawn[i] == (x, colour):
+                        continue
+                    drawn[i] = (x, colour)
+
+                    for unit, ((dx, dy), data) in enumerate(stamp, i * len(stamp)):
+                        cell = at[unit]
+                        if cell is not None:
+                            occupants[cell].discard(unit)
+                            dirty.add(cell)
+                            at[unit] = None
+                        if None in (x, colour):
+                            continue
+
+                        cx, cy = x[0] + dx, x[1] + dy
+                        if not (0 <= cx < width and 0 <= cy < length):
+                            if insert_canvas is None:
+                                raise IndexError
+                            continue
+                        cell = cx + cy * width
+                        at[unit] = cell
+                        shown[unit] = colour if data is CanvasNone else data
+                        occupants[cell].add(unit)
+                        dirty.add(cell)
+
+            for cell in dirty:
+                units = occupants[cell]
+                frame.data[cell] = shown[max(units)] if units else background[cell]
+            yield frame
+
+    def voronoi(self, intercept: float, nearest_neighbour_function = TwoDimensional.circle_from_point,
+                overwrite_template = False, metric: str = None) -> Canvas:
+        """Fills in the CanvasNone cells of an intercept with their nearest data
+        :param nearest_neighbour_function: searched with at growing radii, when no metric is given
+        :param metric: 'euclidean' or 'chebyshev', which finds every nearest cell in one pass
+            (see TwoDimensional.nearest_seed)
+        """
         canvas = self.intercept(intercept)
         template = Canvas.from_canvas(self.template)
 
+        # No nearest data is further away than this
+        max_radius = math.ceil(math.hypot(*canvas.size))
+
+        if metric is not None:
+            seeds = [x for x, data in enumerate(canvas.data) if data is not None and data is not CanvasNone]
+            nearest = TwoDimensional.nearest_seed(canvas.size, seeds, metric)
+
         def closest_data(coord, canvas: Canvas):
-            # TODO: Don't run this eternally
-            r = 0
-            while True:
-                r += 1
+            if metric is not None:
+                if not seeds:
+                    return CanvasNone
+                return canvas.data[nearest[common.twod_to_oned(canvas.size, coord)]]
+
+            for r in range(1, max_radius + 1):
                 for i in nearest_neighbour_function(coord, r):
                     try:
                         if canvas[i] is not CanvasNone:
                             return canvas[i]
                     except IndexError:
                         pass
+            return CanvasNone
 
         for x, data in zip(canvas.get_positions(), canvas):
             if None in (x, data):
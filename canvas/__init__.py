@@ -10,7 +10,8 @@ else:
 from .Layer import Layer, Comparer
 from .Splitter import Splitter
 from .Merger import Merger
+from .Plan import Plan
 from .Transformer import Tracker, Constructor, Binder
-from . import tools
+from . import tools, instrument
 from .BaseClasses import CanvasNone
 from .QuadTree import Seedling as _QuadTree
\ No newline at end of file
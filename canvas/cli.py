@@ -0,0 +1,172 @@
+"""Applies a recipe to every image in a directory, on a pool of processes
+
+    sili-canvas rearrange photos/ sorted/ --sorter hsv
+    sili-canvas fragment_shape photos/ sorted/ --shape circle --size 40 40
+
+Images that already have an output are skipped, so an interrupted run picks up
+where it left off. Outputs are written under a temporary name and renamed once
+saved, so a partly written image is never mistaken for a finished one.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+from .Layer import Layer
+from .Splitter import Splitter
+from .tools import sorters, shapes
+
+
+SORTERS = {name: getattr(sorters, name)
+           for name in ('yiq', 'hsv', 'hls', 'step_sort', 'gradient_step_sort', 'round', 'shuffle')}
+SHAPES = {name: getattr(shapes, name) for name in ('triangle', 'circle', 'vertical_lines')}
+
+
+def rearrange(c, sorter, shape, size):
+    c.rearrange(sorter)
+
+
+def rearrange_segments(c, sorter, shape, size):
+    splitter = Splitter(c)
+    for i in splitter.fragment(size or (c.width, max(1, c.length // 20))):
+        i.rearrange(sorter)
+    splitter.unscope_all()
+
+
+def rearrange_shape(c, sorter, shape, size):
+    layer = Layer(c)
+    layer.intersection(shape)
+    layer.rearrange(sorter)
+    layer.unscope()
+
+
+def fragment_shape(c, sorter, shape, size):
+    splitter = Splitter(c)
+    for i in splitter.fragment(size or (40, 40)):
+        layer = Layer(i)
+        layer.shape_and_rearrange(shape, sorter)
+        layer.unscope()
+    splitter.unscope_all()
+
+
+def rearrange_tessellation(c, sorter, shape, size):
+    size = size or (40, 40)
+    splitter = Splitter(c)
+    for i in splitter.fragment(size):
+        i.reverse()
+        layer = Layer(i)
+        layer.intersection(shape)
+        layer.rearrange(sorter)
+        layer.unscope()
+        i.reverse()
+    splitter.unscope_all()
+
+    # Offset by half a tile, so that the second pass sits between the first
+    portion = splitter.portion((-(size[0] // 2), 0, *splitter.size))
+    new_splitter = Splitter(portion)
+    for i in new_splitter.fragment(size):
+        layer = Layer(i)
+        layer.shape_and_rearrange(shape, sorter)
+        layer.unscope()
+    new_splitter.unscope_all()
+    splitter.unscope_all()
+
+
+RECIPES = {'rearrange': rearrange,
+           'rearrange_segments': rearrange_segments,
+           'rearrange_shape': rearrange_shape,
+           'fragment_shape': fragment_shape,
+           'rearrange_tessellation': rearrange_tessellation}
+
+
+def _partial_path(fp):
+    """Where fp is written to until it's saved, keeping its extension so the format can be told from it"""
+    directory, name = os.path.split(fp)
+    return os.path.join(directory, '.partial-' + name)
+
+
+def _process(job):
+    """Runs one image through a recipe, in a worker
+    :return: (source, seconds, error message or None)
+    """
+    from .pillow_extension import PILCanvas
+
+    source, destination, recipe, sorter, shape, size, mode = job
+    start = time.perf_counter()
+    try:
+        c = PILCanvas.from_image(source, mode, packed=True)
+        RECIPES[recipe](c, SORTERS[sorter], SHAPES[shape], size)
+        partial = _partial_path(destination)
+        c.save(partial, mode)
+        os.replace(partial, destination)
+    except Exception as e:
+        return source, time.perf_counter() - start, '{}: {}'.format(type(e).__name__, e)
+    return source, time.perf_counter() - start, None
+
+
+def _images(directory):
+    from PIL import Image
+
+    extensions = Image.registered_extensions()
+    return sorted(entry.path for entry in os.scandir(directory)
+                  if entry.is_file() and not entry.name.startswith('.partial-')
+                  and os.path.splitext(entry.name)[1].lower() in extensions)
+
+
+def _output_path(source, output, format):
+    name = os.path.basename(source)
+    if format is not None:
+        name = os.path.splitext(name)[0] + '.' + format.lstrip('.')
+    return os.path.join(output, name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='sili-canvas', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('recipe', choices=sorted(RECIPES))
+    parser.add_argument('input', help='directory of images')
+    parser.add_argument('output', help='directory to write the results to, which is created if needed')
+    parser.add_argument('--sorter', choices=sorted(SORTERS), default='yiq')
+    parser.add_argument('--shape', choices=sorted(SHAPES), default='triangle')
+    parser.add_argument('--size', type=int, nargs=2, metavar=('WIDTH', 'LENGTH'),
+                        help='size of the tiles, for the recipes that split the image')
+    parser.add_argument('--mode', default='RGB', help='the mode images are converted to and saved in')
+    parser.add_argument('--format', help='extension to save as, rather than that of each input')
+    parser.add_argument('--processes', type=int, default=None, help='defaults to the number of CPUs')
+    parser.add_argument('--overwrite', action='store_true', help='redo images that already have an output')
+    args = parser.parse_args(argv)
+
+    try:
+        import PIL
+    except ImportError:
+        parser.error('Pillow is required to read and write images')
+
+    os.makedirs(args.output, exist_ok=True)
+    jobs, skipped = [], 0
+    for source in _images(args.input):
+        destination = _output_path(source, args.output, args.format)
+        if not args.overwrite and os.path.exists(destination):
+            skipped += 1
+            continue
+        size = None if args.size is None else tuple(args.size)
+        jobs.append((source, destination, args.recipe, args.sorter, args.shape, size, args.mode))
+
+    print('{} images, {} already done'.format(len(jobs) + skipped, skipped), file=sys.stderr)
+    start = time.perf_counter()
+    failed = 0
+    processes = min(args.processes or os.cpu_count() or 1, len(jobs)) or 1
+    with multiprocessing.Pool(processes) as pool:
+        width = len(str(len(jobs)))
+        for n, (source, seconds, error) in enumerate(pool.imap_unordered(_process, jobs), 1):
+            failed += error is not None
+            print('[{:{}}/{}] {} {:.2f}s{}'.format(n, width, len(jobs), os.path.basename(source), seconds,
+                                                  '' if error is None else ' FAILED ' + error), file=sys.stderr)
+
+    print('{} done, {} failed in {:.2f}s'.format(len(jobs) - failed, failed, time.perf_counter() - start),
+          file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,4 @@
 from . import common
 from . import line_thingy
-from . import sili_math
\ No newline at end of file
+from . import sili_math
+from . import bitmask
\ No newline at end of file
@@ -0,0 +1,48 @@
+"""Sets of canvas positions packed into an int, where bit x is set when position x is in the set
+
+Set algebra then runs a machine word at a time:
+    a & b = intersection, a | b = union, a & ~b = difference, full(n) & ~a = inversion
+"""
+from itertools import compress
+import re
+
+
+_AS_DIGITS = bytes.maketrans(b'\x00\x01', b'01')
+_AS_CELLS = bytes.maketrans(b'01', b'\x00\x01')
+_RUNS = re.compile(b'\x01+')
+
+
+def full(length: int):
+    """Returns the bitmask of every position in a canvas of length cells"""
+    return (1 << length) - 1
+
+
+def from_cells(cells):
+    """Converts a bytes-like object, holding 0 or 1 for each position, into a bitmask"""
+    return int(bytes(cells).translate(_AS_DIGITS)[::-1] or b'0', 2)
+
+
+def to_cells(mask: int, length: int):
+    """Converts a bitmask into bytes, holding 0 or 1 for each of the first length positions"""
+    digits = format(mask & full(length), 'b').zfill(length)
+    return digits[::-1].encode().translate(_AS_CELLS)
+
+
+def from_positions(positions, length: int):
+    cells = bytearray(length)
+    for x in positions:
+        cells[x] = 1
+    return from_cells(cells)
+
+
+def positions(mask: int, length: int):
+    return list(compress(range(length), to_cells(mask, length)))
+
+
+def spans(mask: int, length: int):
+    """Returns the (start, stop) of every run of consecutive positions in the bitmask"""
+    return [match.span() for match in _RUNS.finditer(to_cells(mask, length))]
+
+
+def count(mask: int):
+    return bin(mask).count('1')
@@ -33,7 +33,7 @@ def flatten(iterable, iterations: int=1):
     if isinstance(iterable[0], int) or isinstance(iterable[0], str):
         return iterable
     for _ in range(iterations):
-        iterable = sum(iterable, iterable[0].__class__())
+        iterable = iterable[0].__class__(itertools.chain.from_iterable(iterable))
     return iterable
 
 
@@ -15,6 +15,16 @@ def split_num(x: int):
     return a, b
 
 
+def isqrt(x: int):
+    """The largest int whose square is not above x"""
+    root = int(x ** 0.5)
+    while root * root > x:
+        root -= 1
+    while (root + 1) * (root + 1) <= x:
+        root += 1
+    return root
+
+
 def cheap_round(x: float):
     return int(x + 0.5)
 
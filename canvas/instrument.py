@@ -0,0 +1,187 @@
+"""Opt-in timing of the main entry points
+
+Nothing is wrapped until instrumentation is enabled, and the original methods
+are put back when it is disabled, so there is no cost the rest of the time.
+Times are inclusive, so an entry point that calls another is charged for both.
+Ex:
+    with instrument.measure() as stats:
+        layer.intersection(tools.circle)
+        layer.rearrange(tools.yiq)
+    print(instrument.format_report(stats))
+"""
+from contextlib import contextmanager
+from functools import wraps
+import inspect
+import time
+
+
+# name -> {'calls': int, 'pixels': int, 'seconds': float}
+_stats = {}
+# (owner, attribute, original) of everything wrapped while enabled
+_patched = []
+
+
+def _size(obj):
+    try:
+        return len(obj)
+    except TypeError:
+        size = getattr(obj, 'size', None)
+        return size[0] * size[1] if size else 0
+
+
+# How many pixels a call touches, from (args, result)
+_OF_SELF = lambda args, result: _size(args[0])
+_OF_ARGUMENT = lambda args, result: _size(args[1]) if len(args) > 1 else 0
+_OF_RESULT = lambda args, result: _size(result) if result is not None else 0
+
+
+def _targets():
+    """(owner, attribute, pixels) of every entry point that is timed"""
+    from .BaseClasses import NoneIsImportantTuple
+    from .Canvas import Canvas
+    from .Layer import Layer, PositionalLayer
+    from .Splitter import Splitter
+    from .Transformer import Tracker, Binder, Constructor
+    from .tools import sorters
+
+    targets = [
+        (Canvas, 'insert', _OF_ARGUMENT),
+        (Canvas, 'pack', _OF_SELF),
+        (Canvas, 'unpack', _OF_SELF),
+        (NoneIsImportantTuple, 'putdata', _OF_SELF),
+        (NoneIsImportantTuple, 'rearrange', _OF_SELF),
+        (Splitter, 'portion', _OF_RESULT),
+        (Splitter, 'unscope', _OF_SELF),
+        (Splitter, 'unscope_all', _OF_SELF),
+        (Splitter, 'map', _OF_SELF),
+        (Splitter, 'stream', _OF_SELF),
+        (Layer, 'intersection', _OF_SELF),
+        (Layer, 'union', _OF_SELF),
+        (Layer, 'difference', _OF_SELF),
+        (PositionalLayer, 'invert', _OF_SELF),
+        (PositionalLayer, 'remove_excluded', _OF_SELF),
+        (PositionalLayer, 'remove_unexcluded', _OF_SELF),
+        (Tracker, 'rearrange', _OF_SELF),
+        (Tracker, 'how_did_it_transform', _OF_SELF),
+        (Tracker, 'movement', _OF_SELF),
+        (Tracker, 'transition', _OF_SELF),
+        (Binder, 'movement', _OF_SELF),
+        (Binder, 'transition', _OF_SELF),
+        (Constructor, 'intercept', _OF_RESULT),
+        (Constructor, 'frames', _OF_RESULT),
+        (Constructor, 'voronoi', _OF_RESULT),
+    ]
+    targets.extend((sorters, name, _OF_SELF)
+                   for name, func in vars(sorters).items()
+                   if not name.startswith('_') and hasattr(func, 'argsort'))
+
+    try:
+        from .pillow_extension import PILCanvas
+    except ImportError:
+        pass
+    else:
+        targets.extend([(PILCanvas, 'from_PIL', _OF_RESULT),
+                        (PILCanvas, 'as_PIL', _OF_SELF)])
+    return targets
+
+
+def _record(name, pixels, seconds):
+    stats = _stats.setdefault(name, {'calls': 0, 'pixels': 0, 'seconds': 0.0})
+    stats['calls'] += 1
+    stats['pixels'] += pixels
+    stats['seconds'] += seconds
+
+
+def _timed(func, name, pixels):
+    if inspect.isgeneratorfunction(func):
+        # Only the time spent inside the generator counts, not in whatever consumes it
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            generator = func(*args, **kwargs)
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    _record(name, 0, time.perf_counter() - start)
+                    return
+                _record(name, pixels(args, item), time.perf_counter() - start)
+                yield item
+        return wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        _record(name, pixels(args, result), time.perf_counter() - start)
+        return result
+
+    if hasattr(func, 'argsort'):
+        wrapper.argsort = _timed(func.argsort, name + '.argsort', _OF_SELF)
+    return wrapper
+
+
+def enable():
+    """Starts timing every entry point, until disable is called"""
+    if _patched:
+        return
+    from . import tools
+
+    for owner, attribute, pixels in _targets():
+        # Patch the class that defines the method, so subclasses that inherit it are timed too
+        if isinstance(owner, type):
+            owner = next(i for i in owner.__mro__ if attribute in vars(i))
+        original = vars(owner)[attribute]
+        name = '{}.{}'.format(getattr(owner, '__name__', owner).rpartition('.')[2], attribute)
+
+        if isinstance(original, (classmethod, staticmethod)):
+            wrapper = original.__class__(_timed(original.__func__, name, pixels))
+        else:
+            wrapper = _timed(original, name, pixels)
+        _patched.append((owner, attribute, original))
+        setattr(owner, attribute, wrapper)
+
+        # Sorters are also reached through canvas.tools
+        if getattr(tools, attribute, None) is original:
+            _patched.append((tools, attribute, original))
+            setattr(tools, attribute, wrapper)
+
+
+def disable():
+    """Puts back every method that enable wrapped"""
+    while _patched:
+        owner, attribute, original = _patched.pop()
+        setattr(owner, attribute, original)
+
+
+def reset():
+    _stats.clear()
+
+
+def report():
+    """
+    :return: {name: {'calls': int, 'pixels': int, 'seconds': float}}, for everything called while enabled
+    """
+    return {name: dict(stats) for name, stats in _stats.items()}
+
+
+def format_report(stats=None):
+    """Returns the report as a table, slowest first"""
+    stats = report() if stats is None else stats
+    lines = ['{:40} {:>8} {:>12} {:>10}'.format('', 'calls', 'pixels', 'seconds')]
+    for name, i in sorted(stats.items(), key=lambda i: i[1]['seconds'], reverse=True):
+        lines.append('{:40} {:8} {:12} {:10.4f}'.format(name, i['calls'], i['pixels'], i['seconds']))
+    return '\n'.join(lines)
+
+
+@contextmanager
+def measure():
+    """Times everything within the block, starting from a clean report
+    :return: the report, filled in as the block runs
+    """
+    reset()
+    enable()
+    try:
+        yield _stats
+    finally:
+        disable()
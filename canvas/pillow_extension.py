@@ -1,19 +1,206 @@
+import struct
+import zlib
+
 from .Canvas import Canvas
-from PIL import Image
+from PIL import Image, ImageChops, GifImagePlugin
+
+# Modes whose raw bytes are the canvas' own, and their bands per pixel
+_RAW_MODES = {'L': 1, 'RGB': 3, 'RGBA': 4}
+
 
 class PILCanvas(Canvas):
     @classmethod
-    def from_PIL(cls, im: Image):
+    def from_PIL(cls, im: Image, packed: bool=False):
+        """
+        :param packed: keep the raw bytes of an L, RGB or RGBA image as they are (see Canvas.pack),
+            rather than building a tuple per pixel
+        """
+        if packed and im.mode in _RAW_MODES:
+            return cls.from_buffer(im.tobytes(), im.size, _RAW_MODES[im.mode])
         return cls(im.getdata(), im.size)
 
     @classmethod
-    def from_image(cls, fp, mode):
-        return cls.from_PIL(Image.open(fp).convert(mode))
+    def from_image(cls, fp, mode, packed: bool=False):
+        return cls.from_PIL(Image.open(fp).convert(mode), packed)
 
     def as_PIL(self, mode):
+        # Packed pixels are already laid out as the image's raw bytes, so long as every cell holds one
+        if self.is_packed and self.data.bands == _RAW_MODES.get(mode) and self.data.mask.count(0) == len(self):
+            return Image.frombytes(mode, self.size, self.data.buffer)
+
         im = Image.new(mode, self.size, 'black')
         im.putdata(self.data)
         return im
 
     def save(self, fp, mode, format=None, **params):
         self.as_PIL(mode).save(fp, format=None, **params)
+
+    @staticmethod
+    def frame_sink(fp, mode='RGB', **params):
+        """Returns a FrameSink, which streams the canvases written to it into an animation
+        :param params: see FrameSink
+        """
+        return FrameSink(fp, mode, **params)
+
+
+class FrameSink:
+    """Writes the frames of an animation as they are made, only ever holding on to the last one
+    Ex:
+        with Canvas.frame_sink('result.gif', duration=40) as sink:
+            for frame in constructor.frames(intercepts):
+                sink.write(frame)
+    """
+    def __init__(self, fp, mode: str='RGB', format: str=None, duration: int=100, loop: int=0,
+                 difference: bool=False):
+        """
+        :param fp: filename or binary file object, or a filename pattern such as 'frame{:04d}.png'
+            for a numbered image sequence. APNG needs fp to be seekable
+        :param format: 'GIF', 'APNG' or 'SEQUENCE', which is otherwise told from fp
+        :param duration: milliseconds each frame is shown for, unless write is given another
+        :param loop: how many times the animation plays, 0 being forever
+        :param difference: store only the region that changed from the previous frame,
+            and show the previous frame for longer instead of repeating it. Not used for image sequences
+        """
+        if format is None:
+            format = self._guess_format(fp)
+        writers = {'GIF': (self._write_gif, self._close_gif),
+                   'APNG': (self._write_apng, self._close_apng),
+                   'SEQUENCE': (self._write_image, None)}
+        self._write_frame, self._close_frames = writers[format.upper()]
+
+        self.mode = mode
+        self.duration = duration
+        self.loop = loop
+        self.difference = difference
+        self.frames = 0
+
+        self._own_fp = isinstance(fp, str) and format.upper() != 'SEQUENCE'
+        self.fp = open(fp, 'wb') if self._own_fp else fp
+        self._previous = None  # The last frame, to find what changed in the next one
+        self._pending = None  # (region, offset, duration) of the last frame, until it's known how long it lasts
+        self._actl = None  # Where the frame count of an APNG is, as it's only known at the end
+        self._sequence = 0  # The number of the next APNG fcTL or fdAT chunk
+
+    @staticmethod
+    def _guess_format(fp):
+        name = fp if isinstance(fp, str) else getattr(fp, 'name', '')
+        if isinstance(fp, str) and '{' in fp:
+            return 'SEQUENCE'
+        if name.lower().endswith('.gif'):
+            return 'GIF'
+        if name.lower().endswith(('.png', '.apng')):
+            return 'APNG'
+        raise ValueError('format cannot be told from fp')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, canvas: Canvas, duration: int=None):
+        """Adds a canvas as the next frame
+        :param duration: milliseconds the frame is shown for, otherwise the sink's duration
+        """
+        duration = self.duration if duration is None else duration
+        im = PILCanvas.as_PIL(canvas, self.mode)
+        if self._close_frames is None:
+            self._write_frame(im, (0, 0), duration)
+            return
+
+        region, offset = im, (0, 0)
+        if self.difference and self._previous is not None:
+            bbox = _changed_bbox(self._previous, im)
+            if bbox is None:
+                self._pending = (*self._pending[:2], self._pending[2] + duration)
+                return
+            region, offset = im.crop(bbox), bbox[:2]
+        if self.difference:
+            self._previous = im
+
+        self._flush()
+        self._pending = (region, offset, duration)
+
+    def _flush(self):
+        if self._pending is not None:
+            self._write_frame(*self._pending)
+            self._pending = None
+
+    def close(self):
+        if self._close_frames is not None and self.fp is not None:
+            self._flush()
+            self._close_frames()
+            if self._own_fp:
+                self.fp.close()
+        self.fp = None
+        self._previous = None
+
+    def _write_image(self, im, offset, duration):
+        im.save(self.fp.format(self.frames))
+        self.frames += 1
+
+    def _write_gif(self, im, offset, duration):
+        im = im.convert('RGB').convert('P', palette=Image.ADAPTIVE)
+        if not self.frames:
+            header, _ = GifImagePlugin.getheader(im, info={'loop': self.loop, 'duration': duration})
+            [self.fp.write(i) for i in header]
+        # Each frame brings its own palette, and leaves the frame before in place beneath it
+        params = {'duration': duration, 'disposal': 1, 'include_color_table': True}
+        [self.fp.write(i) for i in GifImagePlugin.getdata(im, offset, **params)]
+        self.frames += 1
+
+    def _close_gif(self):
+        self.fp.write(b';')
+
+    def _write_apng(self, im, offset, duration):
+        colour_types = {'L': 0, 'RGB': 2, 'RGBA': 6}
+        if im.mode not in colour_types:
+            im = im.convert('RGBA' if 'A' in im.mode else 'RGB')
+
+        if not self.frames:
+            self.fp.write(b'\x89PNG\r\n\x1a\n')
+            self.fp.write(_png_chunk(b'IHDR', struct.pack('>IIBBBBB', *im.size, 8, colour_types[im.mode], 0, 0, 0)))
+            self._actl = self.fp.tell()
+            self.fp.write(_png_chunk(b'acTL', struct.pack('>II', 0, self.loop)))
+
+        # Delays are a 16 bit fraction of a second
+        numerator, denominator = duration, 1000
+        while numerator > 0xFFFF and denominator > 1:
+            numerator, denominator = numerator // 10, denominator // 10
+        control = struct.pack('>IIIIIHHBB', self._sequence, *im.size, *offset,
+                              min(numerator, 0xFFFF), denominator, 0, 0)
+        self.fp.write(_png_chunk(b'fcTL', control))
+        self._sequence += 1
+
+        # Every scanline unfiltered
+        stride = im.size[0] * len(im.getbands())
+        data = im.tobytes()
+        data = zlib.compress(b''.join(b'\0' + data[x:x + stride] for x in range(0, len(data), stride)))
+        if not self.frames:
+            self.fp.write(_png_chunk(b'IDAT', data))
+        else:
+            self.fp.write(_png_chunk(b'fdAT', struct.pack('>I', self._sequence) + data))
+            self._sequence += 1
+        self.frames += 1
+
+    def _close_apng(self):
+        self.fp.write(_png_chunk(b'IEND', b''))
+        if self._actl is not None:
+            end = self.fp.tell()
+            self.fp.seek(self._actl)
+            self.fp.write(_png_chunk(b'acTL', struct.pack('>II', self.frames, self.loop)))
+            self.fp.seek(end)
+
+
+def _changed_bbox(im0, im1):
+    """The bbox of every pixel that differs between 2 images, or None when they are the same"""
+    bboxes = [i.getbbox() for i in ImageChops.difference(im0, im1).split()]
+    bboxes = [i for i in bboxes if i is not None]
+    if not bboxes:
+        return None
+    x0s, y0s, x1s, y1s = zip(*bboxes)
+    return min(x0s), min(y0s), max(x1s), max(y1s)
+
+
+def _png_chunk(kind: bytes, data: bytes):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
@@ -1,3 +1,48 @@
+from array import array
+from collections import abc, deque
+from functools import lru_cache
+from itertools import chain, repeat
+from operator import sub, truediv
+
+
+class LinearPath(abc.Sequence):
+    """The coordinates of a line between 2 points, worked out when they are indexed rather than stored.
+    Holds the same coordinates as the lists made by ThreeDimensional.linear and TwoDimensional.linear,
+    in constant memory however long the line is.
+    """
+    __slots__ = ('start', 'directions', 'spans', 'steps')
+
+    def __init__(self, point0, point1, steps: int):
+        self.start = point0
+        self.directions = tuple(-1 if b < a else 1 if b > a else 0 for a, b in zip(point0, point1))
+        self.spans = tuple(abs(b - a) for a, b in zip(point0, point1))
+        self.steps = steps if any(self.spans) else 1
+
+    @staticmethod
+    def natural_steps(point0, point1):
+        return max(abs(b - a) for a, b in zip(point0, point1)) + 1
+
+    def __len__(self):
+        return self.steps
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(self.steps))]
+        if item < 0:
+            item += self.steps
+        if not 0 <= item < self.steps:
+            raise IndexError('LinearPath index out of range')
+        if self.steps == 1:
+            return self.start
+
+        progress = item / (self.steps - 1)
+        return tuple(a + direction * int(progress * span + 0.5)
+                     for a, direction, span in zip(self.start, self.directions, self.spans))
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.start}, {self[-1]}, steps={self.steps})'
+
+
 class ThreeDimensional:
     @staticmethod
     def linear(point0, point1, itr: int=0):
@@ -47,6 +92,25 @@ class ThreeDimensional:
             link.append((x, y, z))
         return link
 
+    @staticmethod
+    def linear_path(point0, point1, itr: int=0):
+        """Same as linear, but the coordinates are worked out as they are indexed
+        """
+        steps = LinearPath.natural_steps(point0, point1)
+        return LinearPath(point0, point1, min(steps, itr) if itr >= 1 else steps)
+
+    @staticmethod
+    def linear_many(pairs, itr: int=0, memo: bool=False):
+        """Returns the coordinates of many lines at once, the same as linear gives for each
+        :param pairs: iterable of (point0, point1)
+        :param memo: rasterize each distinct pair only once
+        :return: (points, offsets) arrays, where points[offsets[i]:offsets[i + 1]] is line i flattened
+        """
+        def steps(point0, point1):
+            natural = LinearPath.natural_steps(point0, point1)
+            return min(natural, itr) if itr >= 1 else natural
+        return _linear_many(pairs, steps, memo)
+
 
 class TwoDimensional:
     @staticmethod
@@ -91,6 +155,23 @@ class TwoDimensional:
             link.append((x, y))
         return link
 
+    @staticmethod
+    def linear_path(point0, point1, itr: int=0):
+        """Same as linear, but the coordinates are worked out as they are indexed
+        """
+        return LinearPath(point0, point1, LinearPath.natural_steps(point0, point1) if itr <= 1 else itr)
+
+    @staticmethod
+    def linear_many(pairs, itr: int=0, memo: bool=False):
+        """Returns the coordinates of many lines at once, the same as linear gives for each
+        :param pairs: iterable of (point0, point1)
+        :param memo: rasterize each distinct pair only once
+        :return: (points, offsets) arrays, where points[offsets[i]:offsets[i + 1]] is line i flattened
+        """
+        def steps(point0, point1):
+            return LinearPath.natural_steps(point0, point1) if itr <= 1 else itr
+        return _linear_many(pairs, steps, memo)
+
     @staticmethod
     def point_bounce(point0, point1, boundary=256):
         x0, y0 = point0
@@ -142,3 +223,158 @@ class TwoDimensional:
                 dx += 2
                 err += dx - r << 1
         return list(link)  # Unsorted due to complexity
+
+    @staticmethod
+    def nearest_seed(size, seeds, metric: str='euclidean'):
+        """Finds the nearest seed to every cell of a grid, in time proportional to its area
+        :param seeds: indexes of the seed cells
+        :param metric: 'euclidean' or 'chebyshev'
+        :return: the index of the nearest seed of each cell, or None when there are no seeds
+        """
+        metrics = {'euclidean': _nearest_seed_euclidean,
+                   'chebyshev': _nearest_seed_chebyshev}
+        return metrics[metric](size, seeds)
+
+
+@lru_cache(maxsize=4096)
+def _runs(span, steps):
+    # How many steps linear stays on each of the span + 1 cells of a shorter axis,
+    # which doesn't depend on where the line is
+    literal_steps = steps - 1
+    starts = [0]
+    for k in range(1, span + 1):
+        # The first step i where int(i / literal_steps * span + 0.5) reaches k,
+        # checking the float sum itself where it lands exactly on k
+        numerator, denominator = (2 * k - 1) * literal_steps, 2 * span
+        i = -(-numerator // denominator)
+        if numerator % denominator == 0 and int(i / literal_steps * span + 0.5) < k:
+            i += 1
+        starts.append(i)
+    starts.append(steps)
+    return tuple(map(sub, starts[1:], starts[:-1]))
+
+
+def _axis(a, b, steps):
+    # The coordinates along one axis of a line of steps steps, as linear works them out
+    direction = 1 if b > a else -1
+    span = abs(b - a)
+    literal_steps = steps - 1
+    if span == 0:
+        return array('q', [a]) * steps
+    if span == literal_steps:
+        return array('q', range(a, b + direction, direction))
+    if span < literal_steps:
+        return array('q', chain.from_iterable(map(repeat, range(a, b + direction, direction), _runs(span, steps))))
+    # Fewer steps than cells, so some cells are skipped: int(i / literal_steps * span + 0.5) kept in C
+    progress = map(truediv, range(steps), repeat(literal_steps))
+    offsets = map(int, map((0.5).__add__, map(float(span).__mul__, progress)))
+    return array('q', map(a.__add__ if direction == 1 else a.__sub__, offsets))
+
+
+def _linear_many(pairs, steps, memo):
+    points, offsets = array('q'), array('q', [0])
+    done = {}
+    for point0, point1 in pairs:
+        if memo:
+            key = (tuple(point0), tuple(point1))
+            if key in done:
+                start, stop = done[key]
+                points.extend(points[start:stop])
+                offsets.append(len(points))
+                continue
+
+        start = len(points)
+        if point0 == point1:
+            points.extend(point0)
+        else:
+            n = steps(point0, point1)
+            points.frombytes(bytes(n * len(point0) * points.itemsize))
+            # Fill in each axis of the line with a strided assignment
+            for axis, (a, b) in enumerate(zip(point0, point1), start):
+                points[axis::len(point0)] = _axis(a, b, n)
+        offsets.append(len(points))
+
+        if memo:
+            done[key] = (start, len(points))
+    return points, offsets
+
+
+def _nearest_seed_chebyshev(size, seeds):
+    # A breadth first search stepping to all 8 neighbours reaches each cell
+    # after as many steps as its chebyshev distance from the nearest seed
+    width, length = size
+    nearest = [None] * (width * length)
+    queue = deque()
+    for x in seeds:
+        if nearest[x] is None:
+            nearest[x] = x
+            queue.append(x)
+
+    steps = [(dx, dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dx or dy]
+    while queue:
+        cell = queue.popleft()
+        y, x = divmod(cell, width)
+        for dx, dy in steps:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < width and 0 <= ny < length:
+                neighbour = nx + ny * width
+                if nearest[neighbour] is None:
+                    nearest[neighbour] = nearest[cell]
+                    queue.append(neighbour)
+    return nearest
+
+
+def _nearest_seed_euclidean(size, seeds):
+    # Felzenszwalb & Huttenlocher's distance transform, keeping track of the seeds:
+    # the nearest seed within each column, then the lower envelope of each row's
+    # parabolas (x - column) ** 2 + (distance to that column's seed) ** 2
+    width, length = size
+    is_seed = bytearray(width * length)
+    for x in seeds:
+        is_seed[x] = 1
+
+    column_nearest = [None] * (width * length)
+    for x in range(width):
+        cells = range(x, width * length, width)
+        last = None
+        for y, cell in enumerate(cells):
+            if is_seed[cell]:
+                last = y
+            column_nearest[cell] = last
+        last = None
+        for y, cell in reversed(list(enumerate(cells))):
+            if is_seed[cell]:
+                last = y
+            elif last is not None and (column_nearest[cell] is None or last - y < y - column_nearest[cell]):
+                column_nearest[cell] = last
+
+    nearest = [None] * (width * length)
+    for y in range(length):
+        row = y * width
+        columns = [x for x in range(width) if column_nearest[row + x] is not None]
+        if not columns:
+            continue
+        heights = [None if i is None else (i - y) ** 2 for i in column_nearest[row:row + width]]
+
+        def meeting(p, q):
+            # Where parabola q drops below parabola p, as a fraction (p < q)
+            return (heights[q] + q * q) - (heights[p] + p * p), 2 * (q - p)
+
+        envelope, starts = [columns[0]], [None]  # None starts before every column
+        for q in columns[1:]:
+            while True:
+                start = meeting(envelope[-1], q)
+                previous = starts[-1]
+                if previous is None or start[0] * previous[1] > previous[0] * start[1]:
+                    break
+                envelope.pop()
+                starts.pop()
+            envelope.append(q)
+            starts.append(start)
+
+        k = 0
+        for x in range(width):
+            while k + 1 < len(envelope) and starts[k + 1][0] <= x * starts[k + 1][1]:
+                k += 1
+            nearest[row + x] = column_nearest[row + envelope[k]] * width + envelope[k]
+    return nearest
@@ -1,7 +1,25 @@
+from functools import lru_cache
 from itertools import starmap
 import math
 
-from ..common import common, sili_math
+from ..common import bitmask, common, sili_math
+
+
+# Shapes applied to many equally sized canvases, such as tiles, reuse their masks
+_MASK_CACHE_SIZE = 256
+
+
+def _mask_from_spans(size, spans):
+    """
+    :param spans: (y, x0, x1) for each run of cells, from x0 up to but not including x1
+    :return: bitmask of the cells
+    """
+    width, length = size
+    cells = bytearray(width * length)
+    for y, x0, x1 in spans:
+        if x1 > x0:
+            cells[y * width + x0:y * width + x1] = bytes([1]) * (x1 - x0)
+    return bitmask.from_cells(cells)
 
 
 def _middle_list(iterable, width: int):
@@ -15,16 +33,42 @@ def _middle_list(iterable, width: int):
     return iterable[i - a: i + b]
 
 
+def _triangle_widths(width, length):
+    return map(int, common.drange(math.ceil(width / length), width + 1, width / length))
+
+
 def triangle(grid):
     width, length = len(grid[0]), len(grid)
 
-    return list(starmap(_middle_list, zip(grid, map(int, common.drange(math.ceil(width / length), width + 1, width / length)))))
+    return list(starmap(_middle_list, zip(grid, _triangle_widths(width, length))))
+
+
+@lru_cache(maxsize=_MASK_CACHE_SIZE)
+def triangle_mask(size):
+    """Bitmask of the cells triangle() keeps from a grid of size"""
+    width, length = size
+    i, _ = sili_math.split_num(width)
+
+    spans = []
+    for y, line in zip(range(length), _triangle_widths(width, length)):
+        if width < line:
+            spans.append((y, 0, width))
+        else:
+            a, b = sili_math.split_num(line)
+            spans.append((y, i - a, i + b))
+    return _mask_from_spans(size, spans)
 
 
 def vertical_lines(grid):
     return tuple(zip(*grid))
 
 
+@lru_cache(maxsize=_MASK_CACHE_SIZE)
+def vertical_lines_mask(size):
+    """Bitmask of the cells vertical_lines() keeps from a grid of size, which is all of them"""
+    return bitmask.full(sili_math.prod(size))
+
+
 def _convertable(grid):
     res = []
     for y, i in enumerate(grid):
@@ -51,6 +95,30 @@ def circle(grid):
     return results
 
 
+@lru_cache(maxsize=_MASK_CACHE_SIZE)
+def circle_mask(size):
+    """Bitmask of the cells circle() keeps from a grid of size,
+    which are those within the circle, moved up and left by one (wrapping around)
+    """
+    width, length = size
+
+    centre = min(sili_math.split_num(width)), min(sili_math.split_num(length))
+    r = min(sili_math.split_num(min(width, length)))
+
+    spans = []
+    for y in range(length):
+        if abs(y - centre[1]) > r:
+            continue
+        reach = sili_math.isqrt(r ** 2 - (y - centre[1]) ** 2)
+        x0, x1 = max(centre[0] - reach, 0), min(centre[0] + reach + 1, width)
+        y -= 1 if y else 1 - length
+        if x0 == 0:
+            spans.append((y, width - 1, width))
+            x0 = 1
+        spans.append((y, x0 - 1, x1 - 1))
+    return _mask_from_spans(size, spans)
+
+
 class quadrilateral:
     @staticmethod
     def portion(grid, pos0, pos1):
@@ -62,6 +130,18 @@ class quadrilateral:
             raise IndexError('Region is outside of range')
         return [i[x0: x1] for i in grid[y0: y1]]
 
+    @staticmethod
+    @lru_cache(maxsize=_MASK_CACHE_SIZE)
+    def portion_mask(size, pos0, pos1):
+        """Bitmask of the cells portion() keeps from a grid of size"""
+        width, length = size
+
+        x0, y0 = pos0
+        x1, y1 = pos1
+        if x0 < 0 or y0 < 0 or x1 > width or y1 > length:
+            raise IndexError('Region is outside of range')
+        return _mask_from_spans(size, [(y, x0, x1) for y in range(y0, y1)])
+
     @staticmethod
     def percentage(grid, percentage0: float, percentage1: float=None):
         if percentage1 is None:
@@ -75,3 +155,24 @@ class quadrilateral:
         y0, y1 = sili_math.split_num(int(y))
 
         return quadrilateral.portion(grid, (x0, y0), (x1, y1))
+
+    @staticmethod
+    def percentage_mask(size, percentage0: float, percentage1: float=None):
+        """Bitmask of the cells percentage() keeps from a grid of size"""
+        if percentage1 is None:
+            percentage1 = percentage0
+        if percentage0 > 1 or percentage1 > 1:
+            raise TypeError('An error here')
+        width, length = size
+
+        x, y = width * percentage0, length * percentage1
+        x0, x1 = sili_math.split_num(int(x))
+        y0, y1 = sili_math.split_num(int(y))
+
+        return quadrilateral.portion_mask(size, (x0, y0), (x1, y1))
+
+
+# Lets Layer use the cached mask when a shape is applied on its own
+triangle.mask = triangle_mask
+vertical_lines.mask = vertical_lines_mask
+circle.mask = circle_mask
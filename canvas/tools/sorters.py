@@ -1,29 +1,117 @@
 import colorsys as _coloursys
 from functools import wraps, partial
+from collections import Counter
+from itertools import chain, islice, repeat
 import math
+from operator import eq
 import random
 
 _round = round
+# Pixels looked at, at a time, to tell whether there are enough repeated colours to sort by colour
+_SAMPLE = 4096
+
+
+def _distinct_keys(func, pixels, conversion=None):
+    """Returns a dict of every distinct colour to its key,
+    or None when there are too few repeats for this to pay off
+    :param conversion: a function of the separate bands, used in place of func
+        to convert all the distinct colours in one pass
+    """
+    limit = len(pixels) // 2
+    try:
+        # A spread out sample turns photo-like pixels away before paying for the whole probe
+        step = max(1, len(pixels) // _SAMPLE)
+        sample = pixels[::step]
+        if len(set(sample)) * 2 > len(sample):
+            return None
+
+        distinct = {}
+        for start in range(0, len(pixels), _SAMPLE):
+            distinct.update(dict.fromkeys(pixels[start:start + _SAMPLE]))
+            if len(distinct) > limit:
+                return None
+    except TypeError:  # Unhashable pixels
+        return None
+    distinct = list(distinct)
+
+    if conversion is not None and distinct:
+        keys = map(conversion, *zip(*distinct))
+    else:
+        keys = map(func, distinct)
+    return dict(zip(distinct, keys))
+
+
+def _sorted_colours(keys):
+    """Returns the colours in sorted order, or None if any two share a key,
+    as their pixels would then interleave
+    """
+    colours = sorted(keys, key=keys.__getitem__)
+    sorted_keys = [keys[i] for i in colours]
+    if any(map(eq, sorted_keys, islice(sorted_keys, 1, None))):
+        return None
+    return colours
+
+
+def _sort(func, pixels, conversion=None):
+    """Sorts like sorted() with key=func, converting each distinct colour once"""
+    keys = _distinct_keys(func, pixels, conversion)
+    if keys is None:
+        # pixels is already a copy, so it's sorted in place rather than copied again
+        pixels.sort(key=func)
+        return pixels
+
+    colours = _sorted_colours(keys)
+    if colours is None:
+        pixels.sort(key=keys.__getitem__)
+        return pixels
+
+    # Stable sorting keeps all the pixels of a colour together
+    counts = Counter(pixels)
+    return list(chain.from_iterable(repeat(i, counts[i]) for i in colours))
+
+
+def _argsort(func, pixels, conversion=None):
+    """Returns the indexes of pixels in the order _sort() puts them"""
+    keys = _distinct_keys(func, pixels, conversion)
+    colours = None if keys is None else _sorted_colours(keys)
+    if colours is None:
+        keys = list(map(func if keys is None else keys.__getitem__, pixels))
+        return sorted(range(len(keys)), key=keys.__getitem__)
+
+    positions = {i: [] for i in colours}
+    for x, i in enumerate(pixels):
+        positions[i].append(x)
+    return list(chain.from_iterable(positions[i] for i in colours))
+
+
+def _make_sorted(func=None, *, conversion=None):
+    if func is None:
+        return partial(_make_sorted, conversion=conversion)
+
+    def argsort(iterable, *args, **kwargs):
+        """Returns the indexes of iterable in the order they are sorted into"""
+        _conversion = None if args or kwargs else conversion
+        return _argsort(partial(func, *args, **kwargs), list(iterable), _conversion)
 
-
-def _make_sorted(func):
     @wraps(func)
     def wrapper(iterable, *args, **kwargs):
-        return sorted(iterable, key=partial(func, *args, **kwargs))
+        _conversion = None if args or kwargs else conversion
+        return _sort(partial(func, *args, **kwargs), list(iterable), _conversion)
+    wrapper.argsort = argsort
     return wrapper
 
 
-@_make_sorted
+@_make_sorted(conversion=_coloursys.rgb_to_yiq)
 def yiq(rgb):
     return _coloursys.rgb_to_yiq(*rgb)
 
 
 def __hsv(rgb):
     return _coloursys.rgb_to_hsv(*rgb)
-hsv = _make_sorted(__hsv)
+hsv = _make_sorted(__hsv, conversion=_coloursys.rgb_to_hsv)
 
 
-@_make_sorted
+@_make_sorted(conversion=_coloursys.rgb_to_hls)
 def hls(rgb):
     return _coloursys.rgb_to_hls(*rgb)
 
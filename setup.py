@@ -9,5 +9,6 @@ setuptools.setup(
     long_description = '',
 
     author = 'SilicalNZ',
-    packages = ['canvas', 'canvas.common', 'canvas.tools']
+    packages = ['canvas', 'canvas.common', 'canvas.tools'],
+    entry_points = {'console_scripts': ['sili-canvas = canvas.cli:main']}
 )